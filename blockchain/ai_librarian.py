@@ -1,41 +1,107 @@
 # © 2024 The Nation of Tamarikemba and Kembacoin Developers  
 # © 2024 Ha Malak BN Adam Aman RA  
 
-import hashlib
 import logging
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import normalize
+from sklearn.cluster import MiniBatchKMeans
 import joblib  # For model persistence
-from blockchain.transactions import LibraryTransaction  # Importing the LibraryTransaction class
+from joblib import Parallel, delayed
+from blockchain.transactions import LibraryTransaction, content_digest  # Importing the LibraryTransaction class
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+# Width of the hashed feature space shared by training and inference
+HASHING_FEATURES = 2**18
+
+# Documents tokenized and hashed per parallel training task
+TRAINING_CHUNK_SIZE = 1000
+
+class InPlaceTfidfTransformer(TfidfTransformer):
+    """
+    TfidfTransformer that weights the incoming term-frequency matrix in place.
+
+    The stock transform copies the input and multiplies by a sparse IDF diagonal; here the
+    IDF vector is kept dense and applied straight to the data buffer of the matrix it is given,
+    which in the librarian pipeline is the fresh matrix produced by HashingVectorizer.
+    """
+
+    def fit(self, X, y=None):
+        super().fit(X, y)
+        self._idf = np.asarray(self.idf_)
+        return self
+
+    def set_idf(self, idf):
+        """
+        Restore IDF weights persisted by a previous fit.
+
+        :param idf: IDF weight per hashed feature
+        """
+        self.idf_ = idf
+        self._idf = np.asarray(idf)
+
+    def transform(self, X, copy=False):
+        X = sp.csr_matrix(X, dtype=np.float64, copy=copy)
+        if self.sublinear_tf:
+            np.log(X.data, out=X.data)
+            X.data += 1
+        if self.use_idf:
+            np.multiply(X.data, self._idf.take(X.indices), out=X.data)
+        if self.norm:
+            normalize(X, norm=self.norm, copy=False)
+        return X
+
+
 class AILibrarian:
     def __init__(self):
         """
         Initialize the AI Librarian with a vectorizer and clustering model.
         """
-        self.vectorizer = TfidfVectorizer(stop_words='english', max_features=5000)
+        self.vectorizer = self.build_vectorizer()
         self.model = None  # Placeholder for the clustering model
 
-    def hash_content(self, content):
+    @staticmethod
+    def build_vectorizer():
         """
-        Generate a SHA-256 hash for the content.
+        Build the stateless hashing + TF-IDF pipeline; only the IDF weights are learned.
 
-        :param content: The content to hash
-        :return: The hash value as a hex string
+        :return: Unfitted vectorizer pipeline
+        """
+        return make_pipeline(
+            HashingVectorizer(n_features=HASHING_FEATURES, alternate_sign=False, norm=None, stop_words='english'),
+            InPlaceTfidfTransformer(),
+        )
+
+    def hash_content_bytes(self, content):
+        """
+        Generate a raw SHA-256 digest for the content.
+
+        :param content: The content to hash, as text, bytes, a file path or a binary file object
+        :return: The 32-byte digest
         """
         try:
-            content_hash = hashlib.sha256(content.encode()).hexdigest()
-            return content_hash
+            # Same hashing as LibraryTransaction.verify_content_hash, so recorded and verified hashes agree
+            return content_digest(content).digest()
         except Exception as e:
             logging.error(f"Error hashing content: {e}")
             raise
 
+    def hash_content(self, content):
+        """
+        Generate a SHA-256 hash for the content.
+
+        :param content: The content to hash, as text, bytes, a file path or a binary file object
+        :return: The hash value as a hex string
+        """
+        return self.hash_content_bytes(content).hex()
+
     def train_model(self, documents, n_clusters=5):
         """
-        Train a KMeans model to categorize content into clusters.
+        Train a mini-batch KMeans model to categorize content into clusters.
 
         :param documents: List of textual documents
         :param n_clusters: Number of clusters/categories
@@ -45,14 +111,38 @@ class AILibrarian:
             raise ValueError("Document list is empty.")
 
         try:
-            tfidf_matrix = self.vectorizer.fit_transform(documents)
-            self.model = KMeans(n_clusters=n_clusters, random_state=42)
+            tfidf_matrix = self.vectorize_corpus(documents)
+            # Mini-batch updates touch a sample of the corpus per step instead of every document
+            self.model = MiniBatchKMeans(
+                n_clusters=n_clusters,
+                batch_size=min(1024, len(documents)),
+                n_init=3,
+                max_no_improvement=10,
+                random_state=42,
+            )
             self.model.fit(tfidf_matrix)
             logging.info("AI Librarian model successfully trained for categorization.")
         except Exception as e:
             logging.error(f"Error during model training: {e}")
             raise
 
+    def vectorize_corpus(self, documents):
+        """
+        Fit a fresh vectorizer on a training corpus, tokenizing and hashing chunks of it in parallel.
+
+        The hashing stage is stateless, so chunks can be transformed independently across
+        processes; only the cheap IDF fit runs on the stacked result.
+
+        :param documents: List of textual documents
+        :return: TF-IDF matrix of the corpus
+        """
+        self.vectorizer = self.build_vectorizer()
+        hashing, tfidf = self.vectorizer[0], self.vectorizer[-1]
+
+        chunks = [documents[i:i + TRAINING_CHUNK_SIZE] for i in range(0, len(documents), TRAINING_CHUNK_SIZE)]
+        counts = Parallel(n_jobs=-1 if len(chunks) > 1 else 1)(delayed(hashing.transform)(chunk) for chunk in chunks)
+        return tfidf.fit_transform(sp.vstack(counts, format="csr"))
+
     def save_model(self, model_path):
         """
         Save the trained model to a file.
@@ -60,8 +150,9 @@ class AILibrarian:
         :param model_path: Path to save the model
         """
         try:
-            joblib.dump({"model": self.model, "vectorizer": self.vectorizer}, model_path)
-            logging.info(f"Model and vectorizer saved to {model_path}.")
+            # The hashing stage is stateless, so the IDF weights are all the vectorizer needs to persist
+            joblib.dump({"model": self.model, "idf": self.vectorizer[-1].idf_}, model_path)
+            logging.info(f"Model and IDF weights saved to {model_path}.")
         except Exception as e:
             logging.error(f"Error saving model: {e}")
             raise
@@ -75,7 +166,12 @@ class AILibrarian:
         try:
             data = joblib.load(model_path)
             self.model = data["model"]
-            self.vectorizer = data["vectorizer"]
+            if "idf" in data:
+                self.vectorizer = self.build_vectorizer()
+                self.vectorizer[-1].set_idf(data["idf"])
+            else:
+                # Older model files pickled the whole fitted vectorizer
+                self.vectorizer = data["vectorizer"]
             logging.info(f"Model and vectorizer loaded from {model_path}.")
         except Exception as e:
             logging.error(f"Error loading model: {e}")
@@ -101,17 +197,40 @@ class AILibrarian:
             logging.error(f"Error categorizing content: {e}")
             raise
 
-    def process_content(self, content, metadata):
+    def categorize_batch(self, contents):
+        """
+        Categorize several documents with a single vectorizer and model call.
+
+        :param contents: List of text contents to categorize
+        :return: Predicted category index for each content, in order
+        """
+        if not self.model:
+            logging.error("AI model is not trained or loaded.")
+            raise ValueError("AI model is not trained or loaded.")
+
+        try:
+            vectorized_contents = self.vectorizer.transform(contents)
+            categories = self.model.predict(vectorized_contents)
+            logging.info(f"{len(contents)} documents categorized in one batch.")
+            return categories
+        except Exception as e:
+            logging.error(f"Error categorizing batch: {e}")
+            raise
+
+    def process_content(self, content, metadata, category=None):
         """
         Hash and categorize content, returning updated metadata, and ensure proper transaction creation.
 
         :param content: The content to process
         :param metadata: Existing metadata for the content
+        :param category: Category already predicted for the content (e.g. by a batch call), if any
         :return: Updated metadata with hash and category
         """
         try:
-            content_hash = self.hash_content(content)
-            category = self.categorize_content(content)
+            # Hex-encode the digest once, only for the JSON-facing metadata and transaction
+            content_hash = self.hash_content_bytes(content).hex()
+            if category is None:
+                category = self.categorize_content(content)
             metadata.update({
                 "hash": content_hash,
                 "category": category,
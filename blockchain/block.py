@@ -4,12 +4,33 @@
 import hashlib
 import logging
 import json
-from datetime import datetime
+import struct
+import time
+from blockchain.mining import find_nonce
 
 # Configure logging for debug purposes
 logging.basicConfig(level=logging.INFO)
 
+# Fixed-width header hashed for proof of work:
+# index, previous hash, timestamp, transaction root, reward (kemites), difficulty, version
+HEADER_STRUCT = struct.Struct("<Q32sd32sQI16s")
+
+# Nonces are hashed as three little-endian uint32 words appended to the header
+NONCE_STRUCT = struct.Struct("<III")
+
+# Header field limits imposed by HEADER_STRUCT and NONCE_STRUCT
+MAX_UINT32 = 2**32 - 1
+MAX_UINT64 = 2**64 - 1
+VERSION_SIZE = 16  # Bytes reserved for the encoded version string
+HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+
 class Block:
+    __slots__ = (
+        "index", "previous_hash", "timestamp", "_transactions", "kemites_reward",
+        "nonce1", "nonce2", "nonce3", "difficulty", "version", "hash",
+        "_tx_blob", "_header", "_nonce_view", "_dict_cache",
+    )
+
     def __init__(self, index, previous_hash, timestamp, transactions, kemites_reward, nonce1, nonce2, nonce3, difficulty, version="4.0"):
         """
         Initialize a block with the necessary parameters.
@@ -17,7 +38,7 @@ class Block:
         self.index = index
         self.previous_hash = previous_hash
         self.timestamp = timestamp
-        self.transactions = transactions if transactions is not None else []  # Ensure transactions is always a list
+        self.transactions = transactions  # Copied into a fresh list by the property setter
         self.kemites_reward = kemites_reward  # Block reward in kemites
         self.nonce1 = nonce1
         self.nonce2 = nonce2
@@ -26,22 +47,59 @@ class Block:
         self.version = version
         self.hash = self.calculate_hash()  # Calculate the hash after all attributes are set
 
+    @property
+    def transactions(self):
+        return self._transactions
+
+    @transactions.setter
+    def transactions(self, transactions):
+        """
+        Replace the block's transactions and drop the cached serialization.
+
+        The list is copied so callers reusing their own list (e.g. a pending pool that
+        is cleared after mining) cannot change the block's content behind the cache.
+        """
+        self._transactions = list(transactions) if transactions is not None else []
+        self._tx_blob = None
+        self._header = None
+        self._dict_cache = None
+
     def calculate_hash(self):
         """
-        Combines block details, version, and transaction data into a single string, then hashes it using SHA-256.
+        Writes the nonces into the packed block header, then hashes the header using SHA-256.
         """
-        # Serialize transactions consistently using json.dumps with sorted keys
-        transaction_data = json.dumps(self.transactions, sort_keys=True)
+        header = self._pack_header()
+        self._nonce_view[:] = self.pack_nonces()
 
-        # Build the block content string
-        block_content = (
-            f"{self.index}{self.previous_hash}{self.timestamp}{transaction_data}"
-            f"{self.kemites_reward}{self.nonce1}{self.nonce2}{self.nonce3}"
-            f"{self.difficulty}{self.version}"
-        )
+        # Return the SHA-256 hash of the header
+        return hashlib.sha256(header).hexdigest()
 
-        # Return the SHA-256 hash of the combined content
-        return hashlib.sha256(block_content.encode()).hexdigest()
+    @classmethod
+    def from_checked_dict(cls, block_data):
+        """
+        Rebuild a block from submitted data whose hash was already checked by check_block_data.
+
+        The claimed hash is taken as-is, so the header is not serialized and hashed a second time.
+        """
+        block = cls.__new__(cls)
+        block.index = block_data["index"]
+        block.previous_hash = block_data["previous_hash"]
+        block.timestamp = block_data["timestamp"]
+        block.transactions = block_data["transactions"]
+        block.kemites_reward = block_data["kemites_reward"]
+        block.nonce1 = block_data["nonce1"]
+        block.nonce2 = block_data["nonce2"]
+        block.nonce3 = block_data["nonce3"]
+        block.difficulty = block_data["difficulty"]
+        block.version = block_data.get("version", "4.0")
+        block.hash = block_data["hash"]
+        return block
+
+    def pack_nonces(self):
+        """
+        Pack the three nonces as a fixed 12-byte little-endian tail (nonce1 is the low word).
+        """
+        return NONCE_STRUCT.pack(self.nonce1, self.nonce2, self.nonce3)
 
     def validate_hash(self):
         """
@@ -57,8 +115,13 @@ class Block:
     def to_dict(self):
         """
         Convert the Block instance to a dictionary representation, ensuring transactions are serialized correctly.
+
+        The dictionary is built once per block hash and shared between callers, so treat it as read-only.
         """
-        return {
+        cached = self._dict_cache
+        if cached is not None and cached[0] == self.hash:
+            return cached[1]
+        block_dict = {
             'index': self.index,
             'previous_hash': self.previous_hash,
             'timestamp': self.timestamp,
@@ -71,59 +134,83 @@ class Block:
             'version': self.version,
             'hash': self.hash,
         }
+        # Keyed on the hash: mining or re-hashing the block produces a new dict
+        self._dict_cache = (self.hash, block_dict)
+        return block_dict
 
-    def mine_block(self, max_iterations=10**8):
+    def mine_block(self, max_iterations=10**8, workers=1):
         """
         Mines the block by adjusting nonces until the hash satisfies the difficulty target.
-        """
-        target = "0" * self.difficulty  # Define difficulty target
-        logging.info(f"Starting mining of block {self.index} with difficulty {self.difficulty}...")
-        start_time = datetime.now()
 
-        # Increment nonces until the hash meets the target
-        iteration = 0
-        static_hash_content = self.calculate_static_hash_content()
-        while not self.hash.startswith(target):
-            self.nonce1 += 1
-            iteration += 1
-
-            if self.nonce1 >= 1_000_000:
-                self.nonce1 = 0
-                self.nonce2 += 1
-                if self.nonce2 >= 1_000_000:
-                    self.nonce2 = 0
-                    self.nonce3 += 1
+        :param max_iterations: Maximum number of nonce increments before giving up.
+        :param workers: Number of processes searching disjoint nonce ranges.
+        """
+        logging.info("Starting mining of block %d with difficulty %d...", self.index, self.difficulty)
+        start_ns = time.perf_counter_ns()
 
-            # Recalculate hash using dynamic nonces
-            self.hash = hashlib.sha256(f"{static_hash_content}{self.nonce1}{self.nonce2}{self.nonce3}".encode()).hexdigest()
+        # Treat the three nonce fields as one 96-bit counter
+        start_nonce = self.nonce1 | (self.nonce2 << 32) | (self.nonce3 << 64)
+        prefix = self.calculate_static_hash_content()
 
-            # Log progress every 10,000 iterations
-            if iteration % 10_000 == 0:
-                logging.info(f"Mining progress: {iteration} iterations... Current hash: {self.hash[:10]}...")
+        result = find_nonce(prefix, self.difficulty, start_nonce, max_iterations + 1, workers=workers)
+        if result:
+            nonce, digest = result
+        else:
+            logging.warning("Mining stopped after %d iterations (max cap reached).", max_iterations)
+            nonce = start_nonce + max_iterations
+            digest = None
 
-            # Break if max iterations exceeded (for debugging/testing purposes)
-            if iteration >= max_iterations:
-                logging.warning(f"Mining stopped after {iteration} iterations (max cap reached).")
-                break
+        # Split the counter back into the wire-format nonce fields; hex-encode only once at the end
+        self.nonce1 = nonce & 0xFFFFFFFF
+        self.nonce2 = (nonce >> 32) & 0xFFFFFFFF
+        self.nonce3 = nonce >> 64
+        self.hash = digest.hex() if digest else self.calculate_hash()
 
-        end_time = datetime.now()
-        duration = (end_time - start_time).total_seconds()
+        duration = (time.perf_counter_ns() - start_ns) / 1e9
 
         logging.info(
-            f"Block {self.index} successfully mined! Hash: {self.hash}, "
-            f"Nonces: [nonce1={self.nonce1}, nonce2={self.nonce2}, nonce3={self.nonce3}], "
-            f"Time taken: {duration:.2f}s."
+            "Block %d successfully mined! Hash: %s, Nonces: [nonce1=%d, nonce2=%d, nonce3=%d], Time taken: %.2fs.",
+            self.index, self.hash, self.nonce1, self.nonce2, self.nonce3, duration
         )
 
     def calculate_static_hash_content(self):
         """
-        Calculate the static portion of the hash content, excluding the dynamic nonces.
+        Return the packed static portion of the header, excluding the trailing nonces.
         """
-        transaction_data = json.dumps(self.transactions, sort_keys=True)
-        return (
-            f"{self.index}{self.previous_hash}{self.timestamp}{transaction_data}"
-            f"{self.kemites_reward}{self.difficulty}{self.version}"
-        )
+        return bytes(self._pack_header()[:HEADER_STRUCT.size])
+
+    def _pack_header(self):
+        """
+        Pack the header into a reusable buffer with room for the nonces at the end.
+
+        Transactions are committed through the SHA-256 of their sorted-key JSON. The buffer
+        is rebuilt only after `transactions` is reassigned; other header fields are not
+        expected to change once the block is created.
+        """
+        if self._header is None:
+            if self._tx_blob is None:
+                # Serialize transactions consistently using json.dumps with sorted keys
+                self._tx_blob = json.dumps(self.transactions, sort_keys=True)
+            self._header = bytearray(HEADER_STRUCT.size + NONCE_STRUCT.size)
+            HEADER_STRUCT.pack_into(
+                self._header, 0,
+                self.index,
+                bytes.fromhex(self.previous_hash.rjust(64, "0")),  # The genesis parent "0" packs as all zeros
+                self.timestamp,
+                hashlib.sha256(self._tx_blob.encode()).digest(),
+                self.kemites_reward,  # Must already be integral kemites; a float is rejected, not truncated
+                self.difficulty,
+                self._encoded_version(),
+            )
+            self._nonce_view = memoryview(self._header)[HEADER_STRUCT.size:]
+        return self._header
+
+    def _encoded_version(self):
+        version = self.version.encode()
+        # "16s" would silently truncate, letting two different versions hash the same
+        if len(version) > VERSION_SIZE:
+            raise ValueError(f"Block version is longer than {VERSION_SIZE} bytes: {self.version!r}")
+        return version
 
     def __str__(self):
         """
@@ -147,3 +234,74 @@ class Block:
             f"timestamp={self.timestamp}, difficulty={self.difficulty}, transactions={len(self.transactions)})"
         )
 
+
+def _is_uint(value, maximum):
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= maximum
+
+
+def _header_field_error(block_data):
+    """
+    Check that submitted header fields fit the packed header layout.
+
+    :return: The reason the fields cannot be packed, or None if they can.
+    """
+    if not _is_uint(block_data["index"], MAX_UINT64):
+        return f"Index out of range: {block_data['index']!r}"
+    previous_hash = block_data["previous_hash"]
+    if not isinstance(previous_hash, str) or not 0 < len(previous_hash) <= 64 or not HEX_DIGITS.issuperset(previous_hash):
+        return f"Previous hash is not a hex digest: {previous_hash!r}"
+    timestamp = block_data["timestamp"]
+    if not isinstance(timestamp, (int, float)) or isinstance(timestamp, bool):
+        return f"Timestamp is not a number: {timestamp!r}"
+    if not isinstance(block_data["transactions"], list):
+        return "Transactions are not a list"
+    if not _is_uint(block_data["kemites_reward"], MAX_UINT64):
+        return f"Reward is not a non-negative integer amount of kemites: {block_data['kemites_reward']!r}"
+    for field in ("nonce1", "nonce2", "nonce3", "difficulty"):
+        if not _is_uint(block_data[field], MAX_UINT32):
+            return f"{field} out of range: {block_data[field]!r}"
+    version = block_data.get("version", "4.0")
+    if not isinstance(version, str) or len(version.encode()) > VERSION_SIZE:
+        return f"Version is not a string of at most {VERSION_SIZE} bytes: {version!r}"
+    if not isinstance(block_data["hash"], str):
+        return f"Hash is not a string: {block_data['hash']!r}"
+    return None
+
+
+def check_block_data(block_data):
+    """
+    Recompute the hash of a submitted block and check it against the claim and the proof of work.
+
+    Side-effect free and picklable, so it can run in a worker process. Malformed fields are
+    reported as a rejection rather than raised.
+
+    :param block_data: Submitted block fields, including the claimed hash.
+    :return: (True, None) if the block's hash is valid, otherwise (False, reason).
+    """
+    try:
+        reason = _header_field_error(block_data)
+    except KeyError as e:
+        return False, f"Missing field {e}"
+    if reason:
+        return False, reason
+    try:
+        block = Block(
+            index=block_data["index"],
+            previous_hash=block_data["previous_hash"],
+            timestamp=block_data["timestamp"],
+            transactions=block_data["transactions"],
+            kemites_reward=block_data["kemites_reward"],
+            nonce1=block_data["nonce1"],
+            nonce2=block_data["nonce2"],
+            nonce3=block_data["nonce3"],
+            difficulty=block_data["difficulty"],
+            version=block_data.get("version", "4.0"),
+        )
+    except (TypeError, ValueError, OverflowError, struct.error) as e:
+        # e.g. transactions that cannot be serialized to JSON
+        return False, f"Block cannot be hashed: {e}"
+    if block.hash != block_data["hash"]:
+        return False, f"Hash mismatch (Expected: {block.hash}, Found: {block_data['hash']})"
+    if not block.hash.startswith("0" * block.difficulty):
+        return False, f"Proof of Work mismatch (Hash: {block.hash}, Difficulty: {block.difficulty})"
+    return True, None
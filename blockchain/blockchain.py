@@ -6,11 +6,14 @@ import json
 import time
 import random
 import logging
+import threading
 from blockchain.q_system import QSystem
 from blockchain.block import Block
 from blockchain.transactions import Transaction
 from blockchain.ai_librarian import AILibrarian
 from blockchain.config import DEFAULT_TRANSACTION_FEE_KEM, KEM_TO_KEMITES_RATIO
+import msgspec
+from blockchain.serialization import BlockStruct, encode_block, iter_chain_json
 from bitcoinrpc.authproxy import AuthServiceProxy, JSONRPCException
 
 CONFIG_PATH = "/etc/kembacoin777/config.json"
@@ -35,13 +38,22 @@ class Blockchain:
         self.version = self.config.get("version", "4.0")
         self.difficulty = self.config.get("difficulty", 4)
         self.chain = [self.create_genesis_block()]  # Blockchain starts with a genesis block
+        self._latest_block = self.chain[0]  # Cached chain tip, updated by _append_block
+        self._chain_structs = [BlockStruct.from_block(self.chain[0])]  # Fixed-schema blocks, appended alongside the chain
+        self._block_json = [encode_block(self._chain_structs[0])]  # Each block's JSON, encoded once when appended
+        self._chain_lock = threading.Lock()  # Serializes the tip check and append across server threads
         self.pending_transactions = []
         self.q_system = QSystem()
+        q_system_state_path = self.config.get("q_system_state_path")
+        if q_system_state_path:
+            self.q_system.load_data(q_system_state_path)
+            self.q_system.enable_wal(q_system_state_path)
         self.max_supply_kem = self.config.get("max_supply_kem", 77_700_000)
         self.total_supply_kemites = self.max_supply_kem * 10**8
         self.current_supply_kemites = 0
         self.block_time = self.config.get("block_time", 7 * 60)  # 7 minutes in seconds
         self.adjustment_interval = self.config.get("adjustment_interval", 5)
+        self.mining_workers = self.config.get("mining_workers", 1)  # Processes searching nonces in parallel
         self.random_intervals = self.config.get("random_intervals", [7, 70, 700, 777, 7000])
         self.next_random_block = self.set_next_random_block()
         self.library_ai = AILibrarian()
@@ -101,13 +113,53 @@ class Blockchain:
         logging.info(f"Next random block will occur at block index {next_block_index}")
         return next_block_index
 
+    @property
+    def latest_block(self):
+        return self._latest_block
+
     def get_latest_block(self):
-        latest_block = self.chain[-1]
-        logging.info(f"Latest Block: Index: {latest_block.index}, Hash: {latest_block.hash}, Previous Hash: {latest_block.previous_hash}")
+        latest_block = self._latest_block
+        logging.info("Latest Block: Index: %s, Hash: %s, Previous Hash: %s",
+                     latest_block.index, latest_block.hash, latest_block.previous_hash)
         return latest_block
 
-    def add_block(self, block):
-        latest_block = self.get_latest_block()
+    def _append_block(self, block):
+        self.chain.append(block)
+        self._latest_block = block
+        block_struct = BlockStruct.from_block(block)
+        self._chain_structs.append(block_struct)
+        self._block_json.append(encode_block(block_struct))
+
+    def chain_dicts(self):
+        """
+        Return the chain as a list of block dicts.
+        """
+        return msgspec.to_builtins(self._chain_structs)
+
+    def chain_json(self):
+        """
+        Return the whole chain as a streamed {"length": n, "chain": [...]} JSON document.
+
+        Every block is encoded once when it is appended, so a request only joins stored bytes
+        and never holds a second full copy of the chain in memory.
+
+        :return: (tip hash, iterator of JSON byte chunks); the tip hash identifies this version of the chain.
+        """
+        # Snapshot the length first so the tip and the streamed blocks always agree
+        length = len(self._block_json)
+        tip_hash = self._chain_structs[length - 1].hash
+        return tip_hash, iter_chain_json(self._block_json, length)
+
+    def add_block(self, block, trusted=False):
+        """
+        Validate a block against the chain tip and append it.
+
+        :param block: Block to add.
+        :param trusted: True for blocks this node mined itself, whose hash was just computed
+            from their own header; the full re-hash is skipped for them.
+        :return: True if the block was added, False if it was rejected.
+        """
+        latest_block = self._latest_block
 
         if block.previous_hash != latest_block.hash:
             logging.warning(
@@ -124,13 +176,62 @@ class Blockchain:
                 f"Block {block.index} rejected: Proof of Work mismatch (Hash: {block.hash}, Difficulty: {block.difficulty}).")
             return False
 
-        if block.hash != block.calculate_hash():
+        if not trusted and not self._verify_hash_once(block):
+            return False
+
+        with self._chain_lock:
+            # Another thread may have extended the chain while this block was being verified
+            if block.previous_hash != self._latest_block.hash:
+                logging.warning(f"Block {block.index} rejected: Chain tip changed during validation.")
+                return False
+            self._append_block(block)
+        logging.info("Block %s added to the chain successfully.", block.index)
+        return True
+
+    @staticmethod
+    def _verify_hash_once(block):
+        """
+        Recompute the block hash a single time and compare it to the claimed one.
+        """
+        recalculated_hash = block.calculate_hash()
+        if block.hash != recalculated_hash:
             logging.warning(
-                f"Block {block.index} rejected: Hash mismatch (Expected: {block.calculate_hash()}, Found: {block.hash}).")
+                f"Block {block.index} rejected: Hash mismatch (Expected: {recalculated_hash}, Found: {block.hash}).")
             return False
+        return True
 
-        self.chain.append(block)
-        logging.info(f"Block {block.index} added to the chain successfully.")
+    @staticmethod
+    def is_valid_transaction(sender, recipient, amount_kem):
+        """
+        Check a transaction's fields. Callers run this before logging the transaction id, so a rejected
+        transaction never occupies its id in the Q-System.
+
+        :return: True if the transaction can be added to the pending pool.
+        """
+        return (bool(sender) and bool(recipient) and isinstance(amount_kem, (int, float))
+                and not isinstance(amount_kem, bool) and amount_kem > 0)
+
+    def add_transaction(self, sender, recipient, amount_kem, signature="", transaction_id=None):
+        """
+        Add a transaction to the pending pool for the next block.
+
+        :param sender: Address of the sender.
+        :param recipient: Address of the recipient.
+        :param amount_kem: Amount of KEM to transfer.
+        :param signature: Transaction signature by the sender.
+        :param transaction_id: The transaction's unique identifier.
+        :return: True if the transaction was added, False if it is malformed.
+        """
+        if not self.is_valid_transaction(sender, recipient, amount_kem):
+            logging.warning(f"Rejected malformed transaction {transaction_id}.")
+            return False
+        self.pending_transactions.append({
+            "sender": sender,
+            "recipient": recipient,
+            "amount_kem": amount_kem,
+            "signature": signature,
+            "transaction_id": transaction_id,
+        })
         return True
 
     def mine_block(self, active_miners, kemites_reward=77 * 10**8):
@@ -157,7 +258,7 @@ class Blockchain:
 
         new_block = Block(
             index=current_block_index,
-            previous_hash=self.get_latest_block().hash,
+            previous_hash=self.latest_block.hash,
             timestamp=time.time(),
             transactions=self.pending_transactions,
             kemites_reward=kemites_reward,
@@ -167,8 +268,10 @@ class Blockchain:
             difficulty=self.difficulty,
             version=self.version,
         )
-        new_block.mine_block()
-        self.chain.append(new_block)
+        new_block.mine_block(workers=self.mining_workers)
+        if not self.add_block(new_block, trusted=True):
+            self.pending_transactions.remove(reward_transaction)
+            return
         self.pending_transactions.clear()
         logging.info(f"Block {new_block.index} mined by {miner_wallet_address}")
 
@@ -0,0 +1,116 @@
+# © 2024 The Nation of Tamarikemba and Kembacoin Developers  
+# © 2024 Ha Malak BN Adam Aman RA  
+
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+
+# Nonces searched per task; small enough that a hit on one core stops the others quickly
+NONCE_STRIDE = 1 << 16
+
+
+def make_miner(difficulty):
+    """
+    Build a nonce search specialised for one difficulty.
+
+    The target is folded into a constant integer threshold held by the closure, so the hot
+    loop compares two ints instead of re-deriving a hex prefix on every attempt.
+
+    :param difficulty: Number of leading hex zeros the block hash must have.
+    :return: Function (prefix, start, count) -> (nonce, digest) or None.
+    """
+    # A hex hash starting with `difficulty` zeros is exactly a digest below this threshold
+    threshold = 1 << (256 - 4 * difficulty)
+    sha256 = hashlib.sha256
+    from_bytes = int.from_bytes
+
+    def miner(prefix, start, count):
+        prefix_hasher = sha256(prefix)
+        for nonce in range(start, start + count):
+            hasher = prefix_hasher.copy()
+            hasher.update(nonce.to_bytes(12, "little"))
+            digest = hasher.digest()
+            if from_bytes(digest, "big") < threshold:
+                return nonce, digest
+        return None
+
+    return miner
+
+
+# Difficulty only changes on retarget, so each process builds its miner once
+_miner_cache = {}
+
+
+def get_miner(difficulty):
+    """
+    Return the cached miner for a difficulty, building it on first use.
+    """
+    miner = _miner_cache.get(difficulty)
+    if miner is None:
+        miner = _miner_cache[difficulty] = make_miner(difficulty)
+    return miner
+
+
+def search_nonces(prefix, difficulty, start, count):
+    """
+    Search the nonce range [start, start + count) for a hash meeting the difficulty.
+
+    :param prefix: Encoded static block content.
+    :param difficulty: Number of leading hex zeros the block hash must have.
+    :param start: First nonce to try.
+    :param count: Number of nonces to try.
+    :return: (nonce, digest) for the first hit, or None if the range is exhausted.
+    """
+    return get_miner(difficulty)(prefix, start, count)
+
+
+def find_nonce(prefix, difficulty, start, attempts, workers=1):
+    """
+    Search `attempts` nonces from `start` in NONCE_STRIDE ranges, optionally across worker processes.
+
+    Each worker takes disjoint ranges; results are consumed in nonce order, so the
+    lowest winning range wins and outstanding ranges are cancelled as soon as it is known.
+
+    :param prefix: Encoded static block content.
+    :param difficulty: Number of leading hex zeros the block hash must have.
+    :param start: First nonce to try.
+    :param attempts: Total number of nonces to try.
+    :param workers: Number of processes to search with (1 searches in-process).
+    :return: (nonce, digest) for the first hit, or None if no nonce met the target.
+    """
+    end = start + attempts
+    ranges = ((offset, min(NONCE_STRIDE, end - offset)) for offset in range(start, end, NONCE_STRIDE))
+
+    if workers <= 1:
+        miner = get_miner(difficulty)
+        for offset, count in ranges:
+            result = miner(prefix, offset, count)
+            if result:
+                return result
+            if logging.getLogger().isEnabledFor(logging.INFO):
+                logging.info("Mining progress: %d nonces searched...", offset + count - start)
+        return None
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Keep every worker busy with one queued range behind the one it is running
+        in_flight = []
+        for offset, count in ranges:
+            in_flight.append(pool.submit(search_nonces, prefix, difficulty, offset, count))
+            if len(in_flight) < workers * 2:
+                continue
+            result = in_flight.pop(0).result()
+            if result:
+                pool.shutdown(cancel_futures=True)
+                return result
+            if logging.getLogger().isEnabledFor(logging.INFO):
+                logging.info("Mining progress: %d nonces searched...", offset - start)
+
+        for future in in_flight:
+            result = future.result()
+            if result:
+                pool.shutdown(cancel_futures=True)
+                return result
+    return None
@@ -4,12 +4,45 @@
 from flask import Flask, jsonify, request
 from kembacoin7.blockchain import Blockchain
 from kembacoin7.p2p_network import P2PNode
+from kembacoin7.serialization import OrjsonProvider
 import logging
 import asyncio
+import msgspec
+from typing import Annotated
+import os
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from signal import signal, SIGINT
 import sys
 
+class TransactionRequest(msgspec.Struct):
+    """
+    Body of /add_transaction and /broadcast_transaction, parsed and validated in a single decode.
+    """
+    sender: str
+    recipient: str
+    amount_kem: Annotated[float, msgspec.Meta(gt=0)]
+    transaction_id: str | int
+    signature: str = ""
+
+
+class MineRequest(msgspec.Struct):
+    miner_address: str
+    kemites_reward: int
+
+
+def decode_body(struct_type):
+    """
+    Decode the raw request body straight into `struct_type`.
+
+    :return: The decoded struct, or None with the error logged if the body is malformed or missing fields.
+    """
+    try:
+        return msgspec.json.decode(request.get_data(), type=struct_type)
+    except msgspec.DecodeError as e:
+        logging.warning(f"Rejected {request.path} request: {e}")
+        return None
+
 class Node:
     def __init__(self, node_id, p2p_node=None):
         self.node_id = node_id
@@ -19,17 +52,35 @@ class Node:
     def display_chain(self):
         logging.info("Displaying the blockchain...")
         try:
-            return [block.to_dict() for block in self.blockchain.chain]
+            return self.blockchain.chain_dicts()
         except Exception as e:
             logging.error(f"Error displaying blockchain: {e}")
             raise
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 blockchain = Blockchain()
 p2p_node = P2PNode(host="127.0.0.1", port=5000, blockchain=blockchain)
 node = Node(node_id="node_1", p2p_node=p2p_node)
 
+# One long-lived event loop shared by the P2P server and every request handler
+event_loop = asyncio.new_event_loop()
+event_loop.set_default_executor(ThreadPoolExecutor(max_workers=int(os.environ.get("THREAD_POOL_SIZE", 32))))
+threading.Thread(target=event_loop.run_forever, name="p2p-event-loop", daemon=True).start()
+
+def _log_background_error(future):
+    if not future.cancelled() and future.exception():
+        logging.error(f"Background P2P task failed: {future.exception()}")
+
+def run_in_background(coro):
+    """
+    Schedule a coroutine on the shared event loop without waiting for it.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, event_loop)
+    future.add_done_callback(_log_background_error)
+    return future
+
 @app.route('/status', methods=['GET'])
 def status():
     return jsonify({"status": "running", "chain_length": len(node.blockchain.chain)}), 200
@@ -37,8 +88,11 @@ def status():
 @app.route('/chain', methods=['GET'])
 def get_chain():
     try:
-        chain = node.display_chain()
-        return jsonify({"chain": chain}), 200
+        tip_hash, chunks = node.blockchain.chain_json()
+        response = app.response_class(chunks, mimetype="application/json")
+        # Clients that already hold this chain tip get a 304 instead of the full chain again
+        response.set_etag(tip_hash)
+        return response.make_conditional(request)
     except Exception as e:
         logging.error(f"Error retrieving blockchain: {e}")
         return jsonify({"error": str(e)}), 500
@@ -46,26 +100,32 @@ def get_chain():
 @app.route('/add_transaction', methods=['POST'])
 def add_transaction():
     try:
-        data = request.json
-        required_fields = ["sender", "recipient", "amount_kem", "transaction_id"]
-        if not all(field in data for field in required_fields):
+        transaction = decode_body(TransactionRequest)
+        if transaction is None:
             return jsonify({"error": "Missing fields in request"}), 400
 
-        transaction_id = data["transaction_id"]
-        validation_status = node.blockchain.q_system.validate_transaction(transaction_id)
-        if validation_status != "valid":
-            return jsonify({"error": f"Transaction {transaction_id} is {validation_status}"}), 400
+        if node.p2p_node.outbound_tx_queue.full():
+            return jsonify({"error": "Broadcast queue is full, retry later"}), 429
+
+        transaction_id = transaction.transaction_id
+        # Validate before logging: a logged id is permanent, so a rejected transaction must not claim it
+        if not node.blockchain.is_valid_transaction(transaction.sender, transaction.recipient, transaction.amount_kem):
+            return jsonify({"error": "Transaction validation failed"}), 400
+        # Logging is the duplicate check: a new transaction is unknown to the Q-System until now
+        if not node.blockchain.q_system.log_transaction(transaction_id):
+            return jsonify({"error": f"Transaction {transaction_id} is duplicate"}), 400
 
         if node.blockchain.add_transaction(
-            sender=data["sender"],
-            recipient=data["recipient"],
-            amount_kem=data["amount_kem"],
-            signature=data.get("signature", ""),
+            sender=transaction.sender,
+            recipient=transaction.recipient,
+            amount_kem=transaction.amount_kem,
+            signature=transaction.signature,
             transaction_id=transaction_id
         ):
-            node.blockchain.q_system.log_transaction(transaction_id)
-            asyncio.run(node.p2p_node.broadcast_transaction(data))
-            return jsonify({"message": "Transaction added and broadcasted successfully"}), 201
+            # Relayed to peers with the next transaction_batch rather than one message per transaction
+            if not node.p2p_node.queue_transaction(msgspec.structs.asdict(transaction)):
+                logging.warning(f"Broadcast queue filled up; transaction {transaction_id} was not relayed.")
+            return jsonify({"message": "Transaction added and queued for broadcast"}), 201
         else:
             return jsonify({"error": "Transaction validation failed"}), 400
     except Exception as e:
@@ -75,18 +135,18 @@ def add_transaction():
 @app.route('/mine', methods=['POST'])
 def mine_block():
     try:
-        data = request.json
-        required_fields = ["miner_address", "kemites_reward"]
-        if not all(field in data for field in required_fields):
+        mine_request = decode_body(MineRequest)
+        if mine_request is None:
             return jsonify({"error": "Missing fields in request"}), 400
 
         node.blockchain.mine_block(
-            active_miners=[data["miner_address"]],
-            kemites_reward=data["kemites_reward"]
+            active_miners=[mine_request.miner_address],
+            kemites_reward=mine_request.kemites_reward
         )
 
         latest_block = node.blockchain.get_latest_block()
-        asyncio.run(node.p2p_node.broadcast_block(latest_block))
+        if not node.p2p_node.queue_block(latest_block):
+            logging.warning(f"Broadcast queue is full; block {latest_block.index} was not relayed.")
         return jsonify({"message": "Block mined and broadcasted successfully"}), 201
     except Exception as e:
         logging.error(f"Error mining block: {e}")
@@ -95,13 +155,13 @@ def mine_block():
 @app.route('/broadcast_transaction', methods=['POST'])
 def broadcast_transaction():
     try:
-        data = request.json
-        required_fields = ["sender", "recipient", "amount_kem", "transaction_id"]
-        if not all(field in data for field in required_fields):
+        transaction = decode_body(TransactionRequest)
+        if transaction is None:
             return jsonify({"error": "Missing fields in request"}), 400
 
-        asyncio.run(node.p2p_node.broadcast_transaction(data))
-        return jsonify({"message": "Transaction broadcasted successfully"}), 200
+        if not node.p2p_node.queue_transaction(msgspec.structs.asdict(transaction)):
+            return jsonify({"error": "Broadcast queue is full, retry later"}), 429
+        return jsonify({"message": "Transaction queued for broadcast"}), 200
     except Exception as e:
         logging.error(f"Error broadcasting transaction: {e}")
         return jsonify({"error": str(e)}), 500
@@ -113,8 +173,9 @@ def broadcast_block():
         if not data.get("block"):
             return jsonify({"error": "Missing block data"}), 400
 
-        asyncio.run(node.p2p_node.broadcast_block(data["block"]))
-        return jsonify({"message": "Block broadcasted successfully"}), 200
+        if not node.p2p_node.queue_block(data["block"]):
+            return jsonify({"error": "Broadcast queue is full, retry later"}), 429
+        return jsonify({"message": "Block queued for broadcast"}), 200
     except Exception as e:
         logging.error(f"Error broadcasting block: {e}")
         return jsonify({"error": str(e)}), 500
@@ -128,10 +189,13 @@ signal(SIGINT, shutdown_gracefully)
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
 
-    def run_p2p_server():
-        asyncio.run(p2p_node.start_server())
-
-    threading.Thread(target=run_p2p_server, daemon=True).start()
+    run_in_background(p2p_node.start_server())
 
-    app.run(host="0.0.0.0", port=5000)
+    if os.environ.get("KEMBACOIN_DEV_SERVER"):
+        app.run(host="0.0.0.0", port=5000)
+    else:
+        # Multi-threaded production server. Under gunicorn keep a single worker so every thread shares
+        # one Blockchain and Q-System:  gunicorn -w 1 -k gthread --threads 32 kembacoin7.node:app
+        from waitress import serve
+        serve(app, host="0.0.0.0", port=5000, threads=int(os.environ.get("HTTP_THREADS", 32)))
 
@@ -4,15 +4,54 @@
 import socket
 import ssl
 import threading
-import json
 import time
 import logging
 import asyncio
-from blockchain.block import Block  # Ensure Block is imported for block reconstruction
+import queue
+import struct
+from collections import OrderedDict, deque
+from blockchain.block import Block, check_block_data  # Ensure Block is imported for block reconstruction
+from blockchain.serialization import from_msgpack_bytes, to_msgpack_bytes
 
 # Configure logging globally
 logging.basicConfig(level=logging.INFO)
 
+# Every message on the wire is a 4-byte big-endian payload length followed by the msgpack payload
+FRAME_HEADER = struct.Struct(">I")
+# Most queued messages coalesced into a single socket write
+MAX_BATCH_MESSAGES = 100
+# Most transactions carried by one transaction_batch message
+MAX_TX_BATCH = 1000
+# Bound on messages waiting for the broadcaster; producers are refused beyond this
+OUTBOUND_QUEUE_SIZE = 10000
+# Recently seen transaction ids remembered for relay dedupe
+SEEN_TRANSACTIONS_LIMIT = 100000
+# Largest payload accepted from a peer; a bigger length prefix drops the connection before anything is buffered
+MAX_FRAME_SIZE = 32 * 1024 * 1024
+
+
+def encode_frame(message):
+    payload = to_msgpack_bytes(message)
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader):
+    """
+    Read one length-prefixed message from a stream.
+
+    :return: The decoded message, or None if the connection was closed or sent an oversized frame.
+    """
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+        (size,) = FRAME_HEADER.unpack(header)
+        if size > MAX_FRAME_SIZE:
+            logging.warning(f"Peer sent a {size}-byte frame (limit {MAX_FRAME_SIZE}); closing the connection.")
+            return None
+        return from_msgpack_bytes(await reader.readexactly(size))
+    except asyncio.IncompleteReadError:
+        return None
+
+
 class NodePeer:
     def __init__(self, host, port, ssl_context):
         self.host = host
@@ -20,116 +59,349 @@ class NodePeer:
         self.ssl_context = ssl_context
         self.socket = None
         self.connected = False
+        self.tls_session = None  # Reused on reconnect to skip the full handshake
+        self.outbox = deque()  # Encoded frames waiting for the next flush
+        self._write_lock = threading.Lock()  # One writer per connection at a time
 
     def connect(self):
         try:
             raw_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket = self.ssl_context.wrap_socket(raw_socket, server_hostname=self.host)
+            raw_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            self.socket = self.ssl_context.wrap_socket(
+                raw_socket, server_hostname=self.host, session=self.tls_session)
             self.socket.connect((self.host, self.port))
             self.connected = True
-            logging.info(f"Connected to peer {self.host}:{self.port} using SSL")
+            logging.info(
+                f"Connected to peer {self.host}:{self.port} using SSL"
+                f"{' (session resumed)' if self.socket.session_reused else ''}")
         except Exception as e:
             logging.error(f"Failed to connect to {self.host}:{self.port}: {e}")
             self.connected = False
 
     def send_message(self, message):
-        if not self.connected:
-            logging.warning(f"Cannot send message. Peer {self.host}:{self.port} is not connected.")
-            return
+        self.outbox.append(encode_frame(message))
+        self.flush()
+
+    def flush(self):
+        """
+        Drain the outbox, coalescing up to MAX_BATCH_MESSAGES frames into each socket write.
+
+        Whichever thread holds the write lock also sends frames queued by others while it waited,
+        so concurrent broadcasts share writes instead of issuing one per message.
+        """
+        with self._write_lock:
+            while self.outbox:
+                if not self.connected:
+                    self.connect()
+                    if not self.connected:
+                        logging.warning(f"Dropping {len(self.outbox)} queued messages for {self.host}:{self.port}.")
+                        self.outbox.clear()
+                        return
+                frames = []
+                while self.outbox and len(frames) < MAX_BATCH_MESSAGES:
+                    frames.append(self.outbox.popleft())
+                self._send_batch(b"".join(frames), len(frames))
+
+    def _send_batch(self, data, count):
         try:
-            self.socket.sendall(json.dumps(message).encode())
-            logging.info(f"Message sent to {self.host}:{self.port}: {message}")
+            self.socket.sendall(data)
+        except (BrokenPipeError, ConnectionResetError, ssl.SSLEOFError) as e:
+            # The peer dropped an idle connection; reconnect once and retry the same batch
+            logging.info(f"Connection to {self.host}:{self.port} lost ({e}), reconnecting.")
+            self.close_connection()
+            self.connect()
+            if not self.connected:
+                return
+            try:
+                self.socket.sendall(data)
+            except Exception as e:
+                logging.error(f"Failed to send message to {self.host}:{self.port}: {e}")
+                self.close_connection()
+                return
         except Exception as e:
             logging.error(f"Failed to send message to {self.host}:{self.port}: {e}")
+            self.close_connection()
+            return
+        logging.debug("Sent %d messages to %s:%d", count, self.host, self.port)
+        self._discard_replies()
+
+    def _discard_replies(self):
+        """
+        Read and drop whatever the peer has sent back on this push connection (e.g. anchor sync replies),
+        so unread replies never fill the peer's send buffer and stall its handler.
+        """
+        try:
+            self.socket.setblocking(False)
+            try:
+                while True:
+                    if not self.socket.recv(65536):
+                        self.close_connection()  # The peer hung up
+                        return
+            finally:
+                if self.connected:
+                    self.socket.setblocking(True)
+        except (ssl.SSLWantReadError, BlockingIOError):
+            pass  # Nothing more to read
+        except Exception as e:
+            logging.info(f"Connection to {self.host}:{self.port} lost while reading replies ({e}).")
+            self.close_connection()
 
     def close_connection(self):
         if self.connected:
+            # TLS 1.3 tickets arrive after the handshake, so capture the session on the way out
+            self.tls_session = self.socket.session or self.tls_session
             self.socket.close()
             self.connected = False
             logging.info(f"Connection to {self.host}:{self.port} closed.")
 
 
 class P2PNode:
-    def __init__(self, host="tamarikemba.com", port=5000, blockchain=None, ssl_cert=None, ssl_key=None):
+    def __init__(self, host="tamarikemba.com", port=5000, blockchain=None, ssl_cert=None, ssl_key=None, ssl_ca=None):
         self.host = host
         self.port = port
         self.blockchain = blockchain
-        self.peers = []
+        self.peers = {}  # (host, port) -> None; a dict for O(1) membership with stable insertion order
+        self._peer_connections = {}  # (host, port) -> persistent NodePeer
+        self._peer_connections_lock = threading.Lock()
+        # Bounded hand-off from request threads to the broadcaster task
+        self.outbound_tx_queue = queue.Queue(maxsize=OUTBOUND_QUEUE_SIZE)
+        self.outbound_block_queue = queue.Queue(maxsize=OUTBOUND_QUEUE_SIZE)
+        self.tx_batch_interval = 0.1  # Seconds between broadcaster flushes
+        self._seen_transactions = OrderedDict()  # transaction_id -> None, oldest first
+        self._seen_transactions_lock = threading.Lock()
+        self._broadcaster_task = None
         self.ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
         if ssl_cert and ssl_key:
             self.ssl_context.load_cert_chain(certfile=ssl_cert, keyfile=ssl_key)
+        # Outbound connections need a client-side context; the server context above cannot connect
+        self.client_ssl_context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=ssl_ca)
 
     async def add_peer(self, peer_host, peer_port):
         peer_address = (peer_host, peer_port)
         if peer_address not in self.peers:
-            self.peers.append(peer_address)
+            self.peers[peer_address] = None
             logging.info(f"Peer added: {peer_host}:{peer_port}")
         else:
             logging.warning(f"Peer {peer_host}:{peer_port} is already connected.")
 
     async def start_server(self):
-        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Accept, TLS handshakes and reads all run on the event loop; no thread per socket call
         try:
-            server.bind((self.host, self.port))
-            server.listen(5)
-            logging.info(f"Node started at {self.host}:{self.port}")
-            while True:
-                client, addr = await asyncio.to_thread(server.accept)
-                logging.info(f"Connection from {addr}")
-                secure_client = self.ssl_context.wrap_socket(client, server_side=True)
-                asyncio.create_task(self.handle_client(secure_client))
+            server = await asyncio.start_server(self.handle_client, self.host, self.port, ssl=self.ssl_context)
         except Exception as e:
             logging.error(f"Error starting server: {e}")
-        finally:
-            server.close()
+            return
+        logging.info(f"Node started at {self.host}:{self.port}")
+        self._broadcaster_task = asyncio.create_task(self.run_broadcaster())
+        async with server:
+            await server.serve_forever()
 
-    async def handle_client(self, client):
+    async def handle_client(self, reader, writer):
+        logging.info(f"Connection from {writer.get_extra_info('peername')}")
+        # Peers keep their connection open, so read messages until they hang up
         try:
-            data = await asyncio.to_thread(client.recv, 4096)
-            message = json.loads(data.decode())
-            logging.info(f"Received message: {message}")
-
-            if message['type'] == 'bitcoin_anchor':
-                anchor_data = message['anchor']
-                self.blockchain.store_bitcoin_anchor(anchor_data)
-                logging.info(f"Bitcoin anchor stored: {anchor_data}")
-                self.broadcast(message)
-            elif message['type'] == 'request_anchor_sync':
-                self.send_anchor_sync(client)
-            else:
-                response = {"status": "error", "reason": "unknown_message_type"}
-                logging.warning(f"Unknown message type received: {message['type']}")
-                client.sendall(json.dumps(response).encode())
+            while True:
+                message = await read_frame(reader)
+                if message is None:
+                    break
+                logging.info(f"Received message: {message}")
+
+                if message['type'] == 'bitcoin_anchor':
+                    anchor_data = message['anchor']
+                    self.blockchain.store_bitcoin_anchor(anchor_data)
+                    logging.info(f"Bitcoin anchor stored: {anchor_data}")
+                    await self.broadcast(message)
+                elif message['type'] == 'block':
+                    # Re-hashing the block is CPU work; keep it off the event loop
+                    await asyncio.get_running_loop().run_in_executor(None, self.receive_block, message['data'])
+                elif message['type'] == 'transaction':
+                    # Logging and pooling take locks; keep them off the event loop
+                    await asyncio.get_running_loop().run_in_executor(None, self.receive_transaction, message['data'])
+                elif message['type'] == 'transaction_batch':
+                    await asyncio.get_running_loop().run_in_executor(None, self.receive_transactions, message['data'])
+                elif message['type'] == 'request_anchor_sync':
+                    self.send_anchor_sync(writer)
+                    await writer.drain()
+                else:
+                    # Peers push one-way; an error reply would only pile up unread on their side
+                    logging.warning(f"Unknown message type received: {message['type']}")
         except Exception as e:
             logging.error(f"Error handling client: {e}")
         finally:
-            client.close()
+            writer.close()
 
     async def broadcast(self, message):
-        for peer_host, peer_port in self.peers:
+        # Encode once and queue the same frame on every peer before any socket is touched
+        frame = encode_frame(message)
+        peers = [self._get_peer(peer_host, peer_port) for peer_host, peer_port in list(self.peers)]
+        for peer in peers:
+            peer.outbox.append(frame)
+        # Flush every peer concurrently so the broadcast takes the slowest peer's time, not the sum
+        results = await asyncio.gather(*(asyncio.to_thread(peer.flush) for peer in peers), return_exceptions=True)
+        for peer, result in zip(peers, results):
+            if isinstance(result, Exception):
+                logging.error(f"Failed to broadcast message to {peer.host}:{peer.port}: {result}")
+
+    async def broadcast_transaction(self, transaction):
+        await self.broadcast({"type": "transaction", "data": transaction})
+
+    def queue_transaction(self, transaction):
+        """
+        Queue a transaction for the next batched broadcast. Safe to call from any thread.
+
+        :return: True if queued (or already relayed), False if the outbound queue is full.
+        """
+        transaction_id = transaction["transaction_id"]
+        if self._is_seen(transaction_id):
+            return True
+        try:
+            self.outbound_tx_queue.put_nowait(transaction)
+        except queue.Full:
+            return False
+        self._mark_seen(transaction_id)
+        return True
+
+    def _is_seen(self, transaction_id):
+        with self._seen_transactions_lock:
+            return transaction_id in self._seen_transactions
+
+    def _mark_seen(self, transaction_id):
+        """
+        Remember a transaction id, evicting the oldest beyond SEEN_TRANSACTIONS_LIMIT.
+
+        :return: True if the id was new, False if it had already been seen.
+        """
+        with self._seen_transactions_lock:
+            if transaction_id in self._seen_transactions:
+                return False
+            self._seen_transactions[transaction_id] = None
+            if len(self._seen_transactions) > SEEN_TRANSACTIONS_LIMIT:
+                self._seen_transactions.popitem(last=False)
+            return True
+
+    def queue_block(self, block):
+        """
+        Queue a block for broadcast. Safe to call from any thread.
+
+        :return: True if queued, False if the outbound queue is full.
+        """
+        try:
+            self.outbound_block_queue.put_nowait(block)
+            return True
+        except queue.Full:
+            return False
+
+    @staticmethod
+    def _drain(outbound_queue, limit):
+        items = []
+        while len(items) < limit:
             try:
-                await asyncio.to_thread(self._send_message, peer_host, peer_port, message)
-            except Exception as e:
-                logging.error(f"Failed to broadcast message to {peer_host}:{peer_port}: {e}")
+                items.append(outbound_queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    async def run_broadcaster(self):
+        """
+        Every tx_batch_interval seconds, broadcast queued blocks, then queued transactions
+        as transaction_batch messages of at most MAX_TX_BATCH each.
+        """
+        while True:
+            await asyncio.sleep(self.tx_batch_interval)
+            for block in self._drain(self.outbound_block_queue, OUTBOUND_QUEUE_SIZE):
+                try:
+                    await self.broadcast_block(block)
+                except Exception as e:
+                    logging.error(f"Failed to broadcast block: {e}")
+            while batch := self._drain(self.outbound_tx_queue, MAX_TX_BATCH):
+                try:
+                    await self.broadcast({"type": "transaction_batch", "data": batch})
+                except Exception as e:
+                    logging.error(f"Failed to broadcast batch of {len(batch)} transactions: {e}")
+
+    def receive_transactions(self, transactions):
+        """
+        Add a batch of relayed transactions, logging them all against a single clock reading.
+
+        :return: Number of transactions added to the pending pool.
+        """
+        now = time.time()
+        return sum(self.receive_transaction(transaction, now) for transaction in transactions)
+
+    def receive_transaction(self, transaction, now=None):
+        """
+        Log and add a transaction relayed by a peer.
+
+        :param now: Clock reading shared by every transaction in the same batch.
+        :return: True if the transaction was new and added to the pending pool.
+        """
+        transaction_id = transaction.get("transaction_id")
+        if transaction_id is None:
+            logging.warning("Dropped relayed transaction without a transaction_id.")
+            return False
+        sender = transaction.get("sender")
+        recipient = transaction.get("recipient")
+        amount_kem = transaction.get("amount_kem")
+        # Validate before the id is remembered or logged, so a rejected copy never claims it
+        if not self.blockchain.is_valid_transaction(sender, recipient, amount_kem):
+            logging.warning(f"Dropped malformed relayed transaction {transaction_id}.")
+            return False
+        # The same transaction arrives once per peer that relays it; only the first copy is processed
+        if not self._mark_seen(transaction_id):
+            return False
+        # Relayed transactions are new to this node's Q-System; a known id means it was already pooled here
+        if not self.blockchain.q_system.log_transaction(transaction_id, now=now):
+            return False
+        return self.blockchain.add_transaction(
+            sender=sender,
+            recipient=recipient,
+            amount_kem=amount_kem,
+            signature=transaction.get("signature", ""),
+            transaction_id=transaction_id
+        )
+
+    def receive_block(self, block_data):
+        """
+        Check and append a block broadcast by a peer.
+
+        :return: True if the block extended the local chain.
+        """
+        if not isinstance(block_data, dict):
+            logging.warning("Rejected relayed block: payload is not a block object.")
+            return False
+        valid, reason = check_block_data(block_data)
+        if not valid:
+            logging.warning(f"Rejected relayed block {block_data.get('index')}: {reason}")
+            return False
+        # check_block_data has just re-hashed the header, so add_block need not do it again
+        return self.blockchain.add_block(Block.from_checked_dict(block_data), trusted=True)
+
+    async def broadcast_block(self, block):
+        block_data = block.to_dict() if hasattr(block, "to_dict") else block
+        await self.broadcast({"type": "block", "data": block_data})
+
+    def _get_peer(self, peer_host, peer_port):
+        """
+        Return the persistent connection for a peer, creating it on first use.
+        """
+        with self._peer_connections_lock:
+            peer = self._peer_connections.get((peer_host, peer_port))
+            if peer is None:
+                peer = NodePeer(peer_host, peer_port, self.client_ssl_context)
+                self._peer_connections[(peer_host, peer_port)] = peer
+            return peer
 
     def _send_message(self, peer_host, peer_port, message):
-        try:
-            raw_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            secure_socket = self.ssl_context.wrap_socket(raw_socket)
-            secure_socket.connect((peer_host, peer_port))
-            secure_socket.sendall(json.dumps(message).encode())
-            secure_socket.close()
-        except Exception as e:
-            logging.error(f"Failed to send message to {peer_host}:{peer_port}: {e}")
+        self._get_peer(peer_host, peer_port).send_message(message)
 
     def request_anchor_sync(self):
         request = {"type": "request_anchor_sync"}
         asyncio.create_task(self.broadcast(request))
 
-    def send_anchor_sync(self, client):
+    def send_anchor_sync(self, writer):
         anchors = self.blockchain.get_all_bitcoin_anchors()
         response = {"type": "anchor_sync", "anchors": anchors}
-        client.sendall(json.dumps(response).encode())
+        writer.write(encode_frame(response))
 
     def announce_bitcoin_anchor(self, anchor_data):
         message = {"type": "bitcoin_anchor", "anchor": anchor_data}
@@ -1,61 +1,177 @@
 # © 2024 The Nation of Tamarikemba and Kembacoin Developers  
 # © 2024 Ha Malak BN Adam Aman RA  
 
+import os
 import time
 import logging
+import shutil
+import tempfile
 import threading
 import json
+import numpy as np
+import orjson
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+# Transaction status codes stored in TransactionTable.status
+PENDING = 0
+COMPLETED = 1
+STATUS_NAMES = ("pending", "completed")
+# Number of independently locked transaction shards; must be a power of two
+TRANSACTION_SHARDS = 64
+# Journal records written between snapshot compactions
+WAL_COMPACT_EVERY = 10000
+
+
+def _write_durable(directory, prefix, suffix, write):
+    """
+    Write a new file in `directory` through `write(file)` and fsync it before returning.
+
+    :return: Path of the written file; it is removed again if writing fails.
+    """
+    fd, path = tempfile.mkstemp(dir=directory, prefix=prefix, suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+def _fsync_directory(directory):
+    if os.name == "posix":
+        # Makes renames and new files in the directory durable; not possible on Windows
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class TransactionTable:
+    """
+    Structure-of-arrays transaction log: one row per transaction, one array per field.
+
+    Rows are appended in logging order and never removed, so a transaction's row is stable.
+    Each table carries its own lock; QSystem shards transactions across several tables.
+    """
+
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows = {}  # Key: transaction_id, Value: row in the arrays below
+        self.ids = []  # Row -> transaction_id
+        self.status = np.zeros(self.INITIAL_CAPACITY, dtype=np.int8)
+        self.timestamp = np.zeros(self.INITIAL_CAPACITY, dtype=np.float64)
+        self.block_index = np.full(self.INITIAL_CAPACITY, -1, dtype=np.int64)  # -1: not tied to a block
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, transaction_id, status, timestamp, block_index=-1):
+        row = len(self.ids)
+        if row == len(self.status):
+            self._grow()
+        self.rows[transaction_id] = row
+        self.ids.append(transaction_id)
+        self.status[row] = status
+        self.timestamp[row] = timestamp
+        self.block_index[row] = block_index
+        return row
+
+    def _grow(self):
+        capacity = len(self.status) * 2
+        self.status = np.resize(self.status, capacity)
+        self.timestamp = np.resize(self.timestamp, capacity)
+        self.block_index = np.resize(self.block_index, capacity)
+
+    def to_arrays(self):
+        count = len(self.ids)
+        return {
+            "status": self.status[:count],
+            "timestamp": self.timestamp[:count],
+            "block_index": self.block_index[:count],
+        }
+
+
 class QSystem:
     def __init__(self):
         """
         Initialize the Q system with a global transaction log and adaptive parameters.
         """
-        self.global_transaction_log = {}  # Key: transaction_id, Value: (status, timestamp)
+        # Global transaction log, sharded by transaction id so unrelated transactions never share a lock
+        self.transaction_shards = [TransactionTable() for _ in range(TRANSACTION_SHARDS)]
+        self.block_hashes = {}  # Block index -> hash, shared by every transaction in the block
         self.timeout_threshold = 30  # Seconds before retrying or flagging late transactions
         self.learning_rate = 0.1  # How quickly Q adapts its parameters
         self.failed_nodes = {}  # Track nodes with repeated failures
-        self.lock = threading.Lock()  # For concurrency control
+        # Column mirror of failed_nodes' last_failure times, so recovery scans are one vectorized compare
+        self._failure_node_ids = np.empty(0, dtype=object)
+        self._failure_times = np.empty(0, dtype=np.float64)
+        self._failure_rows = {}  # node_id -> row in the two arrays above
+        self.lock = threading.Lock()  # Guards failed_nodes, its mirror and timeout_threshold
+        self._wal = None  # Append-only journal of transaction changes since the last snapshot
+        self._wal_path = None
+        self._wal_lock = threading.Lock()
+        self._wal_appends = 0
+        self._compacting = False
 
-    def log_transaction(self, transaction_id, block):
+    def _shard(self, transaction_id):
+        return self.transaction_shards[hash(transaction_id) & (TRANSACTION_SHARDS - 1)]
+
+    def log_transaction(self, transaction_id, block=None, now=None):
         """
         Log a new transaction in the global transaction log.
 
         :param transaction_id: The unique identifier for the transaction.
-        :param block: The block containing the transaction.
+        :param block: The block containing the transaction, if it has been mined.
+        :param now: Current time.time(), when the caller has already sampled it for a batch.
         :return: True if logged successfully, False if duplicate.
         """
-        with self.lock:
-            if transaction_id in self.global_transaction_log:
+        if now is None:
+            now = time.time()
+        shard = self._shard(transaction_id)
+        with shard.lock:
+            if transaction_id in shard.rows:
                 logging.warning(f"Transaction {transaction_id} is duplicate.")
                 return False
-            self.global_transaction_log[transaction_id] = {
-                'status': 'pending',
-                'timestamp': time.time(),
-                'block': block.to_dict()  # Store the block details as well
-            }
+            if block is None:
+                shard.append(transaction_id, PENDING, now)
+                self._append_wal({"op": "log", "id": transaction_id, "ts": now, "block": -1, "hash": None})
+                logging.info(f"Transaction {transaction_id} logged successfully.")
+                return True
+            # Only the block's index and hash are kept, once per block rather than per transaction
+            self.block_hashes[block.index] = block.hash
+            shard.append(transaction_id, PENDING, now, block.index)
+            self._append_wal({"op": "log", "id": transaction_id, "ts": now, "block": block.index, "hash": block.hash})
             logging.info(f"Transaction {transaction_id} logged successfully in Block {block.index}.")
             return True
 
-    def validate_transaction(self, transaction_id):
+    def validate_transaction(self, transaction_id, now=None):
         """
         Validate a transaction to ensure it's not duplicate or late.
 
         :param transaction_id: The unique identifier for the transaction.
+        :param now: Current time.time(), when the caller has already sampled it for a batch.
         :return: "valid", "duplicate", or "late".
         """
-        with self.lock:
-            if transaction_id not in self.global_transaction_log:
+        if now is None:
+            now = time.time()
+        shard = self._shard(transaction_id)
+        with shard.lock:
+            row = shard.rows.get(transaction_id)
+            if row is None:
                 logging.error(f"Transaction {transaction_id} is invalid (unknown or spoofed).")
                 return "invalid"
 
-            entry = self.global_transaction_log[transaction_id]
-            elapsed_time = time.time() - entry['timestamp']
+            elapsed_time = now - shard.timestamp[row]
 
-            if entry['status'] == 'completed':
+            if shard.status[row] == COMPLETED:
                 logging.warning(f"Transaction {transaction_id} is duplicate.")
                 return "duplicate"
             elif elapsed_time > self.timeout_threshold:
@@ -70,9 +186,12 @@ class QSystem:
 
         :param transaction_id: The unique identifier for the transaction.
         """
-        with self.lock:
-            if transaction_id in self.global_transaction_log:
-                self.global_transaction_log[transaction_id]['status'] = 'completed'
+        shard = self._shard(transaction_id)
+        with shard.lock:
+            row = shard.rows.get(transaction_id)
+            if row is not None:
+                shard.status[row] = COMPLETED
+                self._append_wal({"op": "complete", "id": transaction_id})
                 logging.info(f"Transaction {transaction_id} marked as completed.")
             else:
                 logging.error(f"Transaction {transaction_id} not found in log.")
@@ -84,12 +203,17 @@ class QSystem:
         :param node_id: The unique identifier for the node.
         :return: True if node is flagged for failures, False otherwise.
         """
+        now = time.time()
         with self.lock:
             if node_id not in self.failed_nodes:
-                self.failed_nodes[node_id] = {'failures': 0, 'last_failure': time.time()}
+                self.failed_nodes[node_id] = {'failures': 0, 'last_failure': now}
+                self._failure_rows[node_id] = len(self._failure_times)
+                self._failure_node_ids = np.append(self._failure_node_ids, np.array([node_id], dtype=object))
+                self._failure_times = np.append(self._failure_times, now)
             else:
                 self.failed_nodes[node_id]['failures'] += 1
-                self.failed_nodes[node_id]['last_failure'] = time.time()
+                self.failed_nodes[node_id]['last_failure'] = now
+                self._failure_times[self._failure_rows[node_id]] = now
 
             if self.failed_nodes[node_id]['failures'] > 3:
                 logging.warning(f"Node {node_id} flagged for repeated failures.")
@@ -116,16 +240,23 @@ class QSystem:
         """
         Print the Q system's activity log for monitoring and debugging.
         """
-        with self.lock:
-            logging.info("\n===== Q System Activity Log =====")
-            logging.info("Global Transaction Log:")
-            if not self.global_transaction_log:
-                logging.info("  - No transactions logged.")
-            else:
-                for transaction_id, details in self.global_transaction_log.items():
-                    block_info = details['block']
-                    logging.info(f"  - {transaction_id}: {details['status']}, Block {block_info['index']} ({block_info['hash'][:10]}...)")
+        logging.info("\n===== Q System Activity Log =====")
+        logging.info("Global Transaction Log:")
+        logged = 0
+        for shard in self.transaction_shards:
+            with shard.lock:
+                for row, transaction_id in enumerate(shard.ids):
+                    status = STATUS_NAMES[shard.status[row]]
+                    block_index = int(shard.block_index[row])
+                    if block_index < 0:
+                        logging.info(f"  - {transaction_id}: {status}, not yet in a block")
+                    else:
+                        logging.info(f"  - {transaction_id}: {status}, Block {block_index} ({self.block_hashes[block_index][:10]}...)")
+                logged += len(shard)
+        if not logged:
+            logging.info("  - No transactions logged.")
 
+        with self.lock:
             logging.info("\nFailed Nodes:")
             if not self.failed_nodes:
                 logging.info("  - No failed nodes.")
@@ -137,30 +268,70 @@ class QSystem:
         """
         Recover nodes flagged as 'failed' after a stability period.
         """
+        current_time = time.time()
         with self.lock:
-            current_time = time.time()
-            for node_id, info in list(self.failed_nodes.items()):
-                if current_time - info['last_failure'] > 300:  # 5 minutes recovery time
-                    logging.info(f"Node {node_id} has been stable for 5 minutes. Removing from failed nodes.")
-                    del self.failed_nodes[node_id]
+            stable = (current_time - self._failure_times) > 300  # 5 minutes recovery time
+            if not stable.any():
+                return
+            for node_id in self._failure_node_ids[stable]:
+                logging.info(f"Node {node_id} has been stable for 5 minutes. Removing from failed nodes.")
+                del self.failed_nodes[node_id]
+            self._failure_node_ids = self._failure_node_ids[~stable]
+            self._failure_times = self._failure_times[~stable]
+            self._failure_rows = {node_id: row for row, node_id in enumerate(self._failure_node_ids)}
+
+    def _rebuild_failure_index(self):
+        self._failure_node_ids = np.array(list(self.failed_nodes), dtype=object)
+        self._failure_times = np.array([info['last_failure'] for info in self.failed_nodes.values()], dtype=np.float64)
+        self._failure_rows = {node_id: row for row, node_id in enumerate(self.failed_nodes)}
 
     def persist_data(self, file_path):
         """
         Persist the Q system's state to a file for recovery purposes.
 
+        Transaction columns go to a NumPy side file (`<file_path>.<generation>.npz`); the JSON file keeps
+        the transaction ids, the side file's name and the rest of the metadata. Both are written to new
+        files and synced first, then the JSON atomically replaces the old snapshot, so a crash at any
+        point leaves the previous snapshot, with its own side file, intact.
+
         :param file_path: The path to save the Q system data.
         """
         try:
-            with open(file_path, "w") as file:
+            transaction_ids, columns = [], []
+            for shard in self.transaction_shards:
+                with shard.lock:
+                    transaction_ids.extend(shard.ids)
+                    columns.append(shard.to_arrays())
+            arrays = {field: np.concatenate([column[field] for column in columns]) for field in columns[0]}
+            directory = os.path.dirname(os.path.abspath(file_path))
+            base_name = os.path.basename(file_path)
+            arrays_path = _write_durable(directory, f"{base_name}.", ".npz", lambda file: np.savez(file, **arrays))
+            # Copy under the lock, encode outside it
+            with self.lock:
                 data = {
-                    "global_transaction_log": self.global_transaction_log,
-                    "failed_nodes": self.failed_nodes,
+                    "transaction_ids": transaction_ids,
+                    "arrays_file": os.path.basename(arrays_path),
+                    "block_hashes": dict(self.block_hashes),
+                    "failed_nodes": {node_id: dict(info) for node_id, info in self.failed_nodes.items()},
                     "timeout_threshold": self.timeout_threshold,
                 }
-                json.dump(data, file)
-                logging.info(f"Q System data persisted to {file_path}.")
+            try:
+                json_path = _write_durable(directory, f".{base_name}.", ".tmp",
+                                           lambda file: file.write(json.dumps(data).encode()))
+                os.replace(json_path, file_path)
+            except BaseException:
+                os.unlink(arrays_path)
+                raise
+            _fsync_directory(directory)
+            # Side files of earlier snapshots, including the legacy fixed-name one, are now unreferenced
+            for name in os.listdir(directory):
+                if name.startswith(f"{base_name}.") and name.endswith(".npz") and name != data["arrays_file"]:
+                    os.remove(os.path.join(directory, name))
+            logging.info(f"Q System data persisted to {file_path}.")
+            return True
         except Exception as e:
             logging.error(f"Failed to persist Q System data: {e}")
+            return False
 
     def load_data(self, file_path):
         """
@@ -169,12 +340,124 @@ class QSystem:
         :param file_path: The path to load the Q system data from.
         """
         try:
-            with open(file_path, "r") as file:
-                data = json.load(file)
-                self.global_transaction_log = data.get("global_transaction_log", {})
-                self.failed_nodes = data.get("failed_nodes", {})
-                self.timeout_threshold = data.get("timeout_threshold", self.timeout_threshold)
-                logging.info(f"Q System data loaded from {file_path}.")
+            if not os.path.exists(file_path):
+                logging.info(f"No Q System snapshot at {file_path}; starting from the journal alone.")
+            else:
+                self._load_snapshot(file_path)
         except Exception as e:
             logging.error(f"Failed to load Q System data: {e}")
 
+        # Changes journaled after the snapshot; .wal.old is left behind by an unfinished compaction
+        replayed = self._replay_wal(f"{file_path}.wal.old") + self._replay_wal(f"{file_path}.wal")
+        if replayed:
+            logging.info(f"Replayed {replayed} journaled Q System changes.")
+
+    def _load_snapshot(self, file_path):
+        with open(file_path, "r") as file:
+            data = json.load(file)
+            self.transaction_shards = [TransactionTable() for _ in range(TRANSACTION_SHARDS)]
+            if "global_transaction_log" in data:
+                self._load_legacy_log(data["global_transaction_log"])
+            else:
+                self._load_arrays(file_path, data)
+            self.failed_nodes = data.get("failed_nodes", {})
+            self._rebuild_failure_index()
+            self.timeout_threshold = data.get("timeout_threshold", self.timeout_threshold)
+            logging.info(f"Q System data loaded from {file_path}.")
+
+    def enable_wal(self, file_path):
+        """
+        Journal every transaction change to `<file_path>.wal` and fold it into the snapshot at
+        `file_path` every WAL_COMPACT_EVERY records. Call after load_data(file_path).
+
+        :param file_path: The snapshot path used with persist_data and load_data.
+        """
+        with self._wal_lock:
+            self._wal_path = file_path
+            self._wal = open(f"{file_path}.wal", "ab", buffering=0)
+
+    def _append_wal(self, record):
+        if self._wal is None:
+            return
+        line = orjson.dumps(record) + b"\n"
+        with self._wal_lock:
+            self._wal.write(line)
+            self._wal_appends += 1
+            if self._wal_appends < WAL_COMPACT_EVERY or self._compacting:
+                return
+            self._compacting = True
+        threading.Thread(target=self.compact_wal, daemon=True).start()
+
+    def compact_wal(self):
+        """
+        Start a fresh journal, write a snapshot, then drop the journal the snapshot now covers.
+        """
+        path = self._wal_path
+        try:
+            with self._wal_lock:
+                self._wal.close()
+                if os.path.exists(f"{path}.wal.old"):
+                    # A previous compaction failed to snapshot; keep its records ahead of these
+                    with open(f"{path}.wal", "rb") as current, open(f"{path}.wal.old", "ab") as previous:
+                        shutil.copyfileobj(current, previous)
+                    os.remove(f"{path}.wal")
+                else:
+                    os.replace(f"{path}.wal", f"{path}.wal.old")
+                self._wal = open(f"{path}.wal", "ab", buffering=0)
+                self._wal_appends = 0
+            # Records journaled after the rotation may also land in the snapshot; replay is idempotent
+            if self.persist_data(path):
+                os.remove(f"{path}.wal.old")
+        except Exception as e:
+            logging.error(f"Failed to compact Q System journal: {e}")
+        finally:
+            self._compacting = False
+
+    def _replay_wal(self, wal_path):
+        if not os.path.exists(wal_path):
+            return 0
+        replayed = 0
+        with open(wal_path, "rb") as wal:
+            for line in wal:
+                try:
+                    record = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    break  # Torn final record from a crash mid-write
+                shard = self._shard(record["id"])
+                if record["op"] == "log":
+                    if record["id"] not in shard.rows:
+                        if record["hash"] is not None:
+                            self.block_hashes[record["block"]] = record["hash"]
+                        shard.append(record["id"], PENDING, record["ts"], record["block"])
+                elif record["op"] == "complete":
+                    row = shard.rows.get(record["id"])
+                    if row is not None:
+                        shard.status[row] = COMPLETED
+                replayed += 1
+        return replayed
+
+    def _load_arrays(self, file_path, data):
+        # Snapshots before generation-named side files used a fixed "<file_path>.npz"
+        arrays_file = data.get("arrays_file")
+        if arrays_file:
+            arrays_path = os.path.join(os.path.dirname(os.path.abspath(file_path)), arrays_file)
+        else:
+            arrays_path = f"{file_path}.npz"
+        with np.load(arrays_path) as arrays:
+            status, timestamp, block_index = arrays["status"], arrays["timestamp"], arrays["block_index"]
+        for row, transaction_id in enumerate(data.get("transaction_ids", [])):
+            self._shard(transaction_id).append(transaction_id, status[row], timestamp[row], block_index[row])
+        self.block_hashes = {int(index): block_hash for index, block_hash in data.get("block_hashes", {}).items()}
+
+    def _load_legacy_log(self, log):
+        """
+        Rebuild the transaction shards from the old dict-per-transaction file format.
+        """
+        for transaction_id, entry in log.items():
+            block = entry.get("block")
+            block_index = -1
+            if block:
+                block_index = block["index"]
+                self.block_hashes[block_index] = block["hash"]
+            status = COMPLETED if entry["status"] == "completed" else PENDING
+            self._shard(transaction_id).append(transaction_id, status, entry["timestamp"], block_index)
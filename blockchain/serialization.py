@@ -0,0 +1,110 @@
+# © 2024 The Nation of Tamarikemba and Kembacoin Developers  
+# © 2024 Ha Malak BN Adam Aman RA  
+
+from typing import Any
+
+import msgpack
+import msgspec
+import orjson
+from flask.json.provider import JSONProvider
+
+
+def _default(obj):
+    """
+    Serialize objects orjson does not handle natively, such as Block instances and raw bytes.
+    """
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return bytes(obj).hex()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# numpy arrays and scalars (AI library scores) and int-keyed dicts encode without a fallback
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def to_json_bytes(obj):
+    """
+    Encode an object to UTF-8 JSON bytes with orjson.
+    """
+    return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+
+
+def to_msgpack_bytes(obj):
+    """
+    Encode an object to msgpack, the binary format used on the P2P wire.
+    """
+    return msgpack.packb(obj, default=_default, use_bin_type=True)
+
+
+def from_msgpack_bytes(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+class BlockStruct(msgspec.Struct):
+    """
+    Fixed-schema mirror of Block.to_dict(); msgspec encodes it field by field without dict dispatch.
+    """
+    index: int
+    previous_hash: str
+    timestamp: float
+    transactions: list[Any]
+    kemites_reward: int
+    nonce1: int
+    nonce2: int
+    nonce3: int
+    difficulty: int
+    version: str
+    hash: str
+
+    @classmethod
+    def from_block(cls, block):
+        return cls(**block.to_dict())
+
+
+_block_encoder = msgspec.json.Encoder()
+
+# Blocks joined into each chunk yielded by iter_chain_json
+CHAIN_STREAM_BATCH = 256
+
+
+def encode_block(block):
+    """
+    Encode one BlockStruct as JSON bytes.
+    """
+    return _block_encoder.encode(block)
+
+
+def iter_chain_json(fragments, length):
+    """
+    Stream the {"length": n, "chain": [...]} JSON document served by /chain from pre-encoded blocks.
+
+    :param fragments: Per-block JSON bytes, in chain order.
+    :param length: Number of leading fragments to include.
+    :return: Generator of JSON byte chunks.
+    """
+    yield b'{"length":%d,"chain":[' % length
+    for start in range(0, length, CHAIN_STREAM_BATCH):
+        chunk = b",".join(fragments[start:min(start + CHAIN_STREAM_BATCH, length)])
+        yield b"," + chunk if start else chunk
+    yield b"]}"
+
+
+class OrjsonProvider(JSONProvider):
+    """
+    Flask JSON provider that encodes and decodes with orjson instead of the stdlib json module.
+
+    Install with `app.json = OrjsonProvider(app)`; jsonify and request.get_json then go through orjson.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return to_json_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response instead of round-tripping through str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(to_json_bytes(obj), mimetype="application/json")
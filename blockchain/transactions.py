@@ -1,7 +1,13 @@
 # © 2024 The Nation of Tamarikemba and Kembacoin Developers  
 # © 2024 Ha Malak BN Adam Aman RA  
 
+import hashlib
+import hmac
 import logging
+import mmap
+import os
+import threading
+from decimal import ROUND_DOWN, Decimal
 from ecdsa_keygen import ECDSA_keygen  # Ensure this import reflects your codebase implementation
 from blockchain.config import DEFAULT_TRANSACTION_FEE_KEM, KEM_TO_KEMITES_RATIO
 
@@ -9,6 +15,36 @@ from blockchain.config import DEFAULT_TRANSACTION_FEE_KEM, KEM_TO_KEMITES_RATIO
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+# Bound once; hashlib's OpenSSL backend already uses the CPU's SHA extensions where present
+_sha256 = hashlib.sha256
+
+_TLS = threading.local()
+
+
+def _get_ecdsa():
+    """
+    Return this thread's ECDSA_keygen, created on first use instead of once per sign/verify call.
+    """
+    instance = getattr(_TLS, "instance", None)
+    if instance is None:
+        instance = _TLS.instance = ECDSA_keygen()
+    return instance
+
+
+def kem_to_kemites(amount_kem):
+    """
+    Convert a KEM amount to integer kemites without going through a float product.
+    The node and the wallet both convert through this function, so they always agree on an amount.
+
+    :param amount_kem: Amount in KEM as int, float, Decimal or numeric string.
+    :return: Amount in kemites, rounded down (toward zero) at the kemite.
+    """
+    if isinstance(amount_kem, int):
+        return amount_kem * KEM_TO_KEMITES_RATIO
+    # str() gives the shortest decimal that round-trips the float, so 0.29 scales to exactly 29000000
+    amount = Decimal(str(amount_kem)) if isinstance(amount_kem, float) else Decimal(amount_kem)
+    return int((amount * KEM_TO_KEMITES_RATIO).to_integral_value(rounding=ROUND_DOWN))
+
 
 class Transaction:
     def __init__(self, sender, recipient, amount_kem, signature, fee_kem=DEFAULT_TRANSACTION_FEE_KEM):
@@ -31,20 +67,32 @@ class Transaction:
 
         self.sender = sender  # Sender's address
         self.recipient = recipient  # Recipient's address
-        self.amount_kemites = int(amount_kem * KEM_TO_KEMITES_RATIO)  # Convert amount to kemites
-        self.fee_kemites = int(fee_kem * KEM_TO_KEMITES_RATIO)  # Convert fee to kemites
+        self.amount_kemites = kem_to_kemites(amount_kem)  # Convert amount to kemites
+        self.fee_kemites = kem_to_kemites(fee_kem)  # Convert fee to kemites
         self.signature = signature  # Signature by the sender
-        self.transaction_id = self.generate_transaction_id()  # Unique transaction ID
+        self._transaction_id = None  # Computed on first access
+        # Static part of the ID preimage, encoded once instead of on every ID computation
+        self._id_prefix = f"{sender}{recipient}".encode()
+
+        logging.debug("Transaction created: %s", self)  # %s defers __str__ until the record is emitted
 
-        logging.info(f"Transaction created: {self}")
+    @property
+    def transaction_id(self):
+        """
+        Unique transaction ID.
+        """
+        if self._transaction_id is None:
+            self._transaction_id = self.generate_transaction_id()
+        return self._transaction_id
 
     def generate_transaction_id(self):
         """
         Generate a unique transaction ID based on the sender, recipient, amount, and current time.
         """
-        import hashlib
-        transaction_data = f"{self.sender}{self.recipient}{self.amount_kemites}{self.fee_kemites}{self.signature}"
-        return hashlib.sha256(transaction_data.encode()).hexdigest()
+        hasher = _sha256(self._id_prefix)
+        hasher.update(b"%d%d" % (self.amount_kemites, self.fee_kemites))
+        hasher.update(str(self.signature).encode())
+        return hasher.hexdigest()
 
     @staticmethod
     def sign_transaction(private_key, sender, recipient, amount_kem):
@@ -59,11 +107,15 @@ class Transaction:
         :raises ValueError: If signing fails due to invalid inputs.
         """
         try:
-            transaction_data = f"{sender}->{recipient}:{int(amount_kem * KEM_TO_KEMITES_RATIO)}"
-            ecdsa_keygen = ECDSA_keygen()
+            transaction_data = f"{sender}->{recipient}:{kem_to_kemites(amount_kem)}"
+            ecdsa_keygen = _get_ecdsa()
             ecdsa_keygen.private_key = private_key
-            signature = ecdsa_keygen.sign_message(transaction_data)
-            logging.info("Transaction signed successfully.")
+            try:
+                signature = ecdsa_keygen.sign_message(transaction_data)
+            finally:
+                # The instance outlives this call; don't leave the key on it
+                ecdsa_keygen.private_key = None
+            logging.debug("Transaction signed successfully.")
             return signature
         except ValueError as e:
             logging.error(f"Error signing transaction: {e}")
@@ -72,20 +124,18 @@ class Transaction:
             logging.error(f"Unexpected error during signing: {e}")
             raise RuntimeError(f"Unexpected error during signing: {e}")
 
-    def verify_transaction(self, public_key):
+    def verify_transaction(self, public_key=None):
         """
         Verify that the transaction was signed by the sender's private key.
 
-        :param public_key: The sender's public key for verification.
+        :param public_key: The sender's public key; kept for existing callers, ECDSA_keygen verifies without it.
         :return: True if valid, False otherwise.
         :raises ValueError: If verification fails due to invalid inputs.
         """
         try:
-            transaction_data = f"{self.sender}->{self.recipient}:{self.amount_kemites}"
-            ecdsa_keygen = ECDSA_keygen()
-            result = ecdsa_keygen.verify_signature(self.signature, transaction_data)
+            result = Transaction.verify_batch([self])[0]
             if result:
-                logging.info("Transaction verification succeeded.")
+                logging.debug("Transaction verification succeeded.")
             else:
                 logging.warning("Transaction verification failed.")
             return result
@@ -96,6 +146,33 @@ class Transaction:
             logging.error(f"Unexpected error during verification: {e}")
             raise RuntimeError(f"Unexpected error during verification: {e}")
 
+    def signing_message(self):
+        """
+        The message covered by the sender's signature.
+        """
+        return f"{self.sender}->{self.recipient}:{self.amount_kemites}"
+
+    @staticmethod
+    def verify_batch(transactions):
+        """
+        Verify the signatures of many transactions, e.g. a block's worth or a mempool refill.
+
+        One verifier instance serves the whole batch, and identical (signature, message) pairs
+        are only checked once.
+
+        :param transactions: Transactions to verify.
+        :return: List of booleans, True where the signature is valid.
+        """
+        ecdsa_keygen = _get_ecdsa()
+        verified = {}
+        results = []
+        for transaction in transactions:
+            key = (transaction.signature, transaction.signing_message())
+            if key not in verified:
+                verified[key] = bool(ecdsa_keygen.verify_signature(*key))
+            results.append(verified[key])
+        return results
+
     def __str__(self):
         """
         Provides a readable string representation of the transaction.
@@ -105,6 +182,32 @@ class Transaction:
                 f"fee={self.fee_kemites / KEM_TO_KEMITES_RATIO} KEM ({self.fee_kemites} kemites))")
 
 
+def content_digest(content):
+    """
+    SHA-256 hasher over library content without copying it. Shared by upload hashing
+    (AILibrarian.hash_content_bytes) and verification (LibraryTransaction.verify_content_hash).
+
+    :param content: str, any bytes-like object (bytes, bytearray, memoryview, numpy array), a file path
+        or a binary file object.
+    :return: hashlib hasher fed with the whole content.
+    """
+    if isinstance(content, str):
+        return _sha256(content.encode())
+    if isinstance(content, os.PathLike):
+        hasher = _sha256()
+        with open(content, "rb") as file:
+            # mmap fails on empty files; an empty file hashes as empty content
+            if os.fstat(file.fileno()).st_size:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    hasher.update(mapped)
+        return hasher
+    if hasattr(content, "readinto"):
+        # Open files are streamed through OpenSSL without Python-level chunking
+        return hashlib.file_digest(content, _sha256)
+    # Buffer-protocol objects are hashed in place; hashlib reads the memory directly
+    return _sha256(memoryview(content).cast("B"))
+
+
 class LibraryTransaction:
     def __init__(self, uploader, title, hash_value, category, fee_kemites):
         """
@@ -127,23 +230,28 @@ class LibraryTransaction:
         self.uploader = uploader
         self.title = title
         self.hash_value = hash_value
+        try:
+            self._hash_digest = bytes.fromhex(hash_value)  # Raw digest, compared without hex-encoding the content hash
+        except (TypeError, ValueError):
+            raise ValueError("Hash value must be a hex-encoded SHA-256 digest.")
         self.category = category
         self.fee_kemites = int(fee_kemites)
 
-        logging.info(f"Library transaction created: {self}")
+        logging.debug("Library transaction created: %s", self)
 
     def verify_content_hash(self, content):
         """
         Verify that the provided content matches the recorded hash.
 
-        :param content: Content to verify against the recorded hash.
+        :param content: Content to verify against the recorded hash, as str, bytes-like object, file path
+            or binary file object.
+            Paths are memory-mapped so large uploads are hashed without being read into memory.
         :return: True if the content hash matches, False otherwise.
         """
-        import hashlib
         try:
-            content_hash = hashlib.sha256(content.encode()).hexdigest()
-            if content_hash == self.hash_value:
-                logging.info("Content hash verification succeeded.")
+            # Constant-time comparison of the raw digests
+            if hmac.compare_digest(content_digest(content).digest(), self._hash_digest):
+                logging.debug("Content hash verification succeeded.")
                 return True
             else:
                 logging.warning("Content hash verification failed.")
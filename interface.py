@@ -3,6 +3,8 @@
 
 import requests
 import json
+import orjson
+from network import build_session
 
 
 class WalletInterface:
@@ -12,6 +14,7 @@ class WalletInterface:
         :param node_url: URL of the blockchain node.
         """
         self.node_url = node_url
+        self._session = build_session()
 
     def broadcast_transaction(self, sender, recipient, amount_kem, signature):
         """
@@ -29,9 +32,9 @@ class WalletInterface:
             "signature": signature,
         }
         try:
-            response = requests.post(f"{self.node_url}/broadcast_transaction", json=transaction)
-            return response.json()
-        except requests.RequestException as e:
+            response = self._session.post(f"{self.node_url}/broadcast_transaction", json=transaction)
+            return orjson.loads(response.content)
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
             print(f"Error broadcasting transaction: {e}")
             return None
 
@@ -42,9 +45,9 @@ class WalletInterface:
         :return: Balance in KEM or None in case of error.
         """
         try:
-            response = requests.get(f"{self.node_url}/get_balance/{wallet_address}")
-            return response.json()
-        except requests.RequestException as e:
+            response = self._session.get(f"{self.node_url}/get_balance/{wallet_address}")
+            return orjson.loads(response.content)
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
             print(f"Error fetching wallet balance: {e}")
             return None
 
@@ -55,9 +58,9 @@ class WalletInterface:
         :return: Transaction status or None in case of error.
         """
         try:
-            response = requests.get(f"{self.node_url}/transaction_status/{transaction_id}")
-            return response.json()
-        except requests.RequestException as e:
+            response = self._session.get(f"{self.node_url}/transaction_status/{transaction_id}")
+            return orjson.loads(response.content)
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
             print(f"Error fetching transaction status: {e}")
             return None
 
@@ -68,9 +71,9 @@ class WalletInterface:
         :return: List of transactions or None in case of error.
         """
         try:
-            response = requests.get(f"{self.node_url}/get_transaction_history/{wallet_address}")
-            return response.json()
-        except requests.RequestException as e:
+            response = self._session.get(f"{self.node_url}/get_transaction_history/{wallet_address}")
+            return orjson.loads(response.content)
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
             print(f"Error fetching transaction history: {e}")
             return None
 
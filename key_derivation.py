@@ -3,9 +3,7 @@
 
 import os
 import base64
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives.hashes import SHA256
-from cryptography.hazmat.backends import default_backend
+import hashlib
 
 def derive_key_from_password(password, salt=None, iterations=100_000, key_length=32):
     """
@@ -19,13 +17,7 @@ def derive_key_from_password(password, salt=None, iterations=100_000, key_length
     if salt is None:
         salt = os.urandom(16)  # Generate a new random salt
 
-    kdf = PBKDF2HMAC(
-        algorithm=SHA256(),
-        length=key_length,
-        salt=salt,
-        iterations=iterations,
-        backend=default_backend(),
-    )
-    key = kdf.derive(password.encode())
+    # Single call into OpenSSL's PBKDF2; output is identical to cryptography's PBKDF2HMAC
+    key = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations, dklen=key_length)
     return base64.urlsafe_b64encode(key), base64.urlsafe_b64encode(salt)
 
@@ -3,12 +3,13 @@
 
 from flask import Flask, request, jsonify
 from blockchain.blockchain import Blockchain
-from blockchain.block import Block
+from blockchain.block import Block, check_block_data
+from blockchain.serialization import OrjsonProvider
 from flask_cors import CORS
 import logging
 import os
-from functools import lru_cache
-import os
+from typing import Annotated, Any
+import msgspec
 os.environ['address_38f57665762f2def'] = '100'
 
 # Configuration Class
@@ -19,8 +20,37 @@ class Config:
         exit(1)  # Exit the app if critical config is missing
     NODE_PORT = int(os.getenv('NODE_PORT', 5000))  # Default to 5000 if not set
 
+# Request schemas, decoded and validated in one pass straight from the request body
+class TxSubmission(msgspec.Struct):
+    sender: str
+    recipient: str
+    amount_kem: Annotated[int, msgspec.Meta(gt=0)]
+    signature: str
+    transaction_id: str | int
+
+
+# Field bounds of the packed block header, so malformed blocks are a 400 at decode time
+HexDigest = Annotated[str, msgspec.Meta(pattern="^[0-9a-f]{64}$")]
+UInt32 = Annotated[int, msgspec.Meta(ge=0, lt=2**32)]
+NonNegative = Annotated[int, msgspec.Meta(ge=0)]  # msgspec bounds stop at int64; check_block_data caps at uint64
+
+
+class BlockSubmission(msgspec.Struct):
+    index: NonNegative
+    previous_hash: HexDigest
+    timestamp: float
+    transactions: list[Any]
+    kemites_reward: NonNegative
+    nonce1: UInt32
+    nonce2: UInt32
+    nonce3: UInt32
+    difficulty: UInt32
+    hash: HexDigest
+    version: Annotated[str, msgspec.Meta(max_length=16)] = "4.0"
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)  # Serialize responses with orjson
 CORS(app)  # Enable cross-origin requests if needed
 
 # Apply configuration
@@ -77,25 +107,21 @@ def mine_block():
 @app.route('/add_transaction', methods=['POST'])
 def add_transaction():
     """Adds a transaction to the pending transactions pool."""
-    data = request.get_json()
-    required_fields = ['sender', 'recipient', 'amount_kem', 'signature', 'transaction_id']
-
-    if not all(field in data for field in required_fields):
-        logging.warning("Missing transaction fields: %s", [field for field in required_fields if field not in data])
-        return jsonify({"error": "Missing transaction fields"}), 400
-
-    if not isinstance(data['amount_kem'], int) or data['amount_kem'] <= 0:
-        return jsonify({"error": "Amount must be a positive integer"}), 400
+    try:
+        tx = msgspec.json.decode(request.get_data(), type=TxSubmission)
+    except msgspec.DecodeError as e:
+        logging.warning("Rejected transaction: %s", e)
+        return jsonify({"error": f"Invalid transaction: {e}"}), 400
 
     try:
         blockchain.add_transaction(
-            sender=data['sender'],
-            recipient=data['recipient'],
-            amount_kem=data['amount_kem'],
-            signature=data['signature'],
-            transaction_id=data['transaction_id']
+            sender=tx.sender,
+            recipient=tx.recipient,
+            amount_kem=tx.amount_kem,
+            signature=tx.signature,
+            transaction_id=tx.transaction_id
         )
-        logging.info("Transaction added: %s", data['transaction_id'])
+        logging.info("Transaction added: %s", tx.transaction_id)
         return jsonify({"message": "Transaction added successfully"}), 200
     except Exception as e:
         logging.error(f"Error adding transaction: {e}")
@@ -112,12 +138,14 @@ def get_balance(wallet_address):
         return jsonify({"error": "Failed to fetch balance"}), 500
 
 @app.route('/chain', methods=['GET'])
-@lru_cache(maxsize=1)  # Cache the result of this function
 def get_chain():
     """Returns the entire blockchain."""
     try:
-        chain_data = [block.to_dict() for block in blockchain.chain]
-        return jsonify({"length": len(chain_data), "chain": chain_data}), 200
+        # Blocks are encoded once when appended; the response streams the stored bytes
+        tip_hash, chunks = blockchain.chain_json()
+        response = app.response_class(chunks, mimetype="application/json")
+        response.set_etag(tip_hash)
+        return response.make_conditional(request)
     except Exception as e:
         logging.error(f"Error fetching blockchain: {e}")
         return jsonify({"error": "Failed to fetch blockchain"}), 500
@@ -156,32 +184,28 @@ def set_node_port():
 def submit_block():
     """Handles block submissions from miners."""
     try:
-        block_data = request.get_json()
-        logging.info(f"Received block submission: {block_data}")  # Log the incoming payload
-
-        if not block_data:
+        body = request.get_data()
+        if not body:
             return jsonify({"error": "No block data provided"}), 400
 
-        required_fields = ["index", "previous_hash", "timestamp", "transactions", "kemites_reward", "nonce1", "nonce2", "nonce3", "difficulty", "hash"]
-        missing_fields = [field for field in required_fields if field not in block_data]
-
-        if missing_fields:
-            logging.error(f"Missing fields in block submission: {missing_fields}")
-            return jsonify({"error": f"Missing fields: {missing_fields}"}), 400
-
-        new_block = Block(
-            index=block_data["index"],
-            previous_hash=block_data["previous_hash"],
-            timestamp=block_data["timestamp"],
-            transactions=block_data["transactions"],
-            kemites_reward=block_data["kemites_reward"],
-            nonce1=block_data["nonce1"],
-            nonce2=block_data["nonce2"],
-            nonce3=block_data["nonce3"],
-            difficulty=block_data["difficulty"]
-        )
+        try:
+            submission = msgspec.json.decode(body, type=BlockSubmission)
+        except msgspec.DecodeError as e:
+            logging.error(f"Invalid block submission: {e}")
+            return jsonify({"error": f"Invalid block submission: {e}"}), 400
+
+        block_data = msgspec.structs.asdict(submission)
+        logging.info(f"Received block submission: {block_data}")  # Log the incoming payload
+
+        # One SHA-256 over a packed header: cheaper inline than pickling the block to another process.
+        # Malformed fields come back as a rejection, not an exception.
+        valid, reason = check_block_data(block_data)
+        if not valid:
+            logging.warning(f"Block {block_data['index']} rejected: {reason}")
+            return jsonify({"error": "Block validation failed"}), 400
 
-        if blockchain.add_block(new_block):
+        new_block = Block.from_checked_dict(block_data)
+        if blockchain.add_block(new_block, trusted=True):
             logging.info(f"Block {new_block.index} added successfully.")
             return jsonify({"status": "Block added successfully"}), 200
         else:
@@ -195,5 +219,11 @@ def submit_block():
 if __name__ == '__main__':
     # Start the blockchain node server
     logging.info("Starting Kembacoin blockchain node...")
-    app.run(host='0.0.0.0', port=app.config['NODE_PORT'])
+    if os.environ.get("KEMBACOIN_DEV_SERVER"):
+        app.run(host='0.0.0.0', port=app.config['NODE_PORT'])
+    else:
+        # Multi-threaded production server. Under gunicorn keep a single worker so every thread shares
+        # one Blockchain:  gunicorn -w 1 -k gthread --threads 32 --bind 0.0.0.0:$NODE_PORT main:app
+        from waitress import serve
+        serve(app, host='0.0.0.0', port=app.config['NODE_PORT'], threads=int(os.environ.get("HTTP_THREADS", 32)))
 
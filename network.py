@@ -3,6 +3,23 @@
 
 import requests
 import json
+import orjson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def build_session():
+    """
+    Create a requests session that keeps connections to the node alive and reuses them.
+    :return: Configured requests.Session.
+    """
+    session = requests.Session()
+    session.headers["Accept"] = "application/json"
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=Retry(total=3, backoff_factor=0.1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
 
 class Network:
     def __init__(self, node_url="http://127.0.0.1:5000"):
@@ -11,6 +28,7 @@ class Network:
         :param node_url: URL of the blockchain node to connect to.
         """
         self.node_url = node_url
+        self._session = build_session()
 
     def get_latest_block(self):
         """
@@ -18,9 +36,9 @@ class Network:
         :return: Latest block data as a dictionary.
         """
         try:
-            response = requests.get(f"{self.node_url}/latest_block")
-            return response.json()
-        except requests.RequestException as e:
+            response = self._session.get(f"{self.node_url}/latest_block")
+            return orjson.loads(response.content)
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
             print(f"Error fetching latest block: {e}")
             return None
 
@@ -31,25 +49,39 @@ class Network:
         :return: List of transactions.
         """
         try:
-            response = requests.get(f"{self.node_url}/transactions/{address}")
-            return response.json()
-        except requests.RequestException as e:
+            response = self._session.get(f"{self.node_url}/transactions/{address}")
+            return orjson.loads(response.content)
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
             print(f"Error fetching transactions: {e}")
             return []
 
     def broadcast_transaction(self, transaction_data):
         """
         Broadcast a transaction to the blockchain network.
-        :param transaction_data: Transaction details as a dictionary.
+        :param transaction_data: Transaction details as a dictionary, or already-encoded JSON bytes.
         :return: Response from the node.
         """
         try:
-            response = requests.post(f"{self.node_url}/broadcast_transaction", json=transaction_data)
-            return response.json()
-        except requests.RequestException as e:
+            if isinstance(transaction_data, bytes):
+                # Pre-encoded payloads are sent as-is instead of being re-serialized by requests
+                response = self._session.post(f"{self.node_url}/broadcast_transaction", data=transaction_data,
+                                              headers={"Content-Type": "application/json"})
+            else:
+                response = self._session.post(f"{self.node_url}/broadcast_transaction", json=transaction_data)
+            return orjson.loads(response.content)
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
             print(f"Error broadcasting transaction: {e}")
             return {"status": "error", "message": str(e)}
 
+    def broadcast_library_transaction(self, library_transaction, metadata):
+        """
+        Broadcast a library transaction, encoded directly from its msgspec struct.
+        :param library_transaction: WalletLibraryTransaction to broadcast.
+        :param metadata: Metadata dictionary generated by the blockchain AI librarian.
+        :return: Response from the node.
+        """
+        return self.broadcast_transaction(library_transaction.encode_transaction_data(metadata))
+
     def get_utxos(self, address):
         """
         Fetch UTXOs for a specific wallet address.
@@ -57,9 +89,9 @@ class Network:
         :return: List of UTXOs.
         """
         try:
-            response = requests.get(f"{self.node_url}/utxos/{address}")
-            return response.json()
-        except requests.RequestException as e:
+            response = self._session.get(f"{self.node_url}/utxos/{address}")
+            return orjson.loads(response.content)
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
             print(f"Error fetching UTXOs: {e}")
             return []
 
@@ -69,7 +101,7 @@ class Network:
         :return: True if connected, False otherwise.
         """
         try:
-            response = requests.get(f"{self.node_url}/ping")
+            response = self._session.get(f"{self.node_url}/ping")
             return response.status_code == 200
         except requests.RequestException as e:
             print(f"Connection error: {e}")
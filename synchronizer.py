@@ -1,8 +1,33 @@
 # © 2024 The Nation of Tamarikemba and Kembacoin Developers  
 # © 2024 Ha Malak BN Adam Aman RA  
 
-import time
-from threading import Thread
+import asyncio
+import threading
+
+import aiohttp
+
+# Upper bound on concurrent per-address requests in one poll cycle
+MAX_CONCURRENT_REQUESTS = 16
+POLL_INTERVAL = 10  # Seconds between successful polls
+RETRY_DELAY = 5  # First retry delay after an error, doubled on each consecutive failure
+MAX_RETRY_DELAY = 300  # Cap on the retry delay
+
+# One event loop on one thread runs every Synchronizer, created on first start()
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop():
+    """
+    Return the shared synchronization event loop, starting its thread on first use.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="wallet-sync-loop", daemon=True).start()
+        return _loop
+
 
 class Synchronizer:
     def __init__(self, wallet, network):
@@ -14,42 +39,79 @@ class Synchronizer:
         self.wallet = wallet
         self.network = network
         self.running = False
+        self._future = None  # Handle of run() on the shared loop
+        self._wake_event = None  # Set by handle_new_block to poll immediately
 
     def start(self):
         """
-        Start the synchronization process in a separate thread.
+        Start the synchronization process as a task on the shared synchronization loop.
         """
         self.running = True
-        self.sync_thread = Thread(target=self.run)
-        self.sync_thread.start()
+        self._future = asyncio.run_coroutine_threadsafe(self.run(), _get_loop())
 
     def stop(self):
         """
         Stop the synchronization process.
         """
         self.running = False
-        if self.sync_thread:
-            self.sync_thread.join()
+        if self._future:
+            self._future.cancel()
+            self._future = None
 
-    def run(self):
+    async def run(self):
         """
         Main loop for synchronizing the wallet with the blockchain.
+
+        Polls every POLL_INTERVAL seconds; consecutive errors back off exponentially up to MAX_RETRY_DELAY.
         """
-        while self.running:
-            try:
-                # Fetch the latest transactions for the wallet's addresses
-                for address in self.wallet.get_addresses():
-                    transactions = self.network.get_transactions(address)
-                    self.wallet.update_transactions(address, transactions)
-
-                # Update the wallet's balance
-                self.wallet.update_balance()
-
-                # Polling interval
-                time.sleep(10)  # Poll every 10 seconds
-            except Exception as e:
-                print(f"Synchronization error: {e}")
-                time.sleep(5)  # Retry after a short delay
+        self._wake_event = asyncio.Event()
+        retry_delay = RETRY_DELAY
+        connector = aiohttp.TCPConnector(limit=32)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            while self.running:
+                try:
+                    # Fetch the latest transactions for the wallet's addresses
+                    addresses = list(self.wallet.get_addresses())
+                    results = await self._poll(session, addresses)
+                    for address, transactions in zip(addresses, results):
+                        self.wallet.update_transactions(address, transactions)
+
+                    # Update the wallet's balance without blocking the other synchronizers on the loop
+                    await asyncio.get_running_loop().run_in_executor(None, self.wallet.update_balance)
+
+                    delay = POLL_INTERVAL
+                    retry_delay = RETRY_DELAY
+                except Exception as e:
+                    print(f"Synchronization error: {e}")
+                    delay = retry_delay
+                    retry_delay = min(retry_delay * 2, MAX_RETRY_DELAY)
+
+                # Sleep until the next poll, or until a new block wakes the loop
+                try:
+                    await asyncio.wait_for(self._wake_event.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake_event.clear()
+
+    async def _poll(self, session, addresses):
+        """
+        Fetch transactions for all addresses in one round trip's worth of wall time.
+        :param session: Open aiohttp.ClientSession.
+        :param addresses: Wallet addresses to fetch.
+        :return: List of transaction lists, in the same order as addresses.
+        """
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+        async def fetch(address):
+            async with semaphore:
+                try:
+                    async with session.get(f"{self.network.node_url}/transactions/{address}") as response:
+                        return await response.json(content_type=None)
+                except aiohttp.ClientError as e:
+                    print(f"Error fetching transactions: {e}")
+                    return []
+
+        return await asyncio.gather(*(fetch(address) for address in addresses))
 
     def fetch_utxos(self, address):
         """
@@ -65,5 +127,7 @@ class Synchronizer:
         :param block_data: New block data.
         """
         print(f"New block detected: {block_data['block_height']}")
-        self.run()  # Re-synchronize to process changes
+        # Re-synchronize to process changes by waking the running loop instead of starting another one
+        if self.running and self._wake_event is not None:
+            _get_loop().call_soon_threadsafe(self._wake_event.set)
 
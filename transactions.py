@@ -1,27 +1,33 @@
 # © 2024 The Nation of Tamarikemba and Kembacoin Developers  
 # © 2024 Ha Malak BN Adam Aman RA  
 
+import msgspec
 from ecdsa_keygen import ECDSA_keygen  # Import the ECDSA_keygen class for signing and verification
+from blockchain.transactions import kem_to_kemites  # Same KEM -> kemites rounding as the node
 
 
 class WalletTransaction:
+    # Fixed attribute layout: no per-instance __dict__, faster attribute access in sign/get_transaction_data
+    __slots__ = ("sender", "recipient", "amount_kemites", "fee_kemites", "signature")
+
     def __init__(self, sender, recipient, amount_kem, fee_kem=0.01):
         """
         Represents a transaction created by the wallet.
         :param sender: Address of the sender
         :param recipient: Address of the recipient
-        :param amount_kem: Amount of KEM to transfer
+        :param amount_kem: Amount of KEM to transfer (int, float, Decimal or numeric string)
         :param fee_kem: Transaction fee in KEM
         """
-        if amount_kem <= 0:
+        amount_kemites = kem_to_kemites(amount_kem)
+        if amount_kemites <= 0:
             raise ValueError("Transaction amount must be greater than zero.")
         if not sender or not recipient:
             raise ValueError("Sender and recipient addresses cannot be empty.")
 
         self.sender = sender  # Sender's address
         self.recipient = recipient  # Recipient's address
-        self.amount_kemites = int(amount_kem * 10**8)  # Convert amount to kemites
-        self.fee_kemites = int(fee_kem * 10**8)  # Convert fee to kemites
+        self.amount_kemites = amount_kemites  # Amount in kemites
+        self.fee_kemites = kem_to_kemites(fee_kem)  # Convert fee to kemites
         self.signature = None  # Will be set when the transaction is signed
 
     def sign_transaction(self, private_key):
@@ -59,7 +65,22 @@ class WalletTransaction:
                 f"signature={'Present' if self.signature else 'Not signed'})")
 
 
+class LibraryTxn(msgspec.Struct, kw_only=True):
+    """
+    Broadcast payload of a library transaction, built by WalletLibraryTransaction.build_transaction.
+    """
+    type: str = "library"
+    uploader: str
+    title: str
+    cid: str | None = None
+    hash_value: str | None = None
+    category: str | None = None
+    fee_kemites: int
+
+
 class WalletLibraryTransaction:
+    __slots__ = ("uploader", "title", "content", "category", "fee_kemites")
+
     def __init__(self, uploader, title, content, category, fee_kemites):
         """
         Represents a library-related transaction for uploading content to the blockchain.
@@ -73,7 +94,7 @@ class WalletLibraryTransaction:
         self.title = title
         self.content = content
         self.category = category
-        self.fee_kemites = int(fee_kemites * 10**8)
+        self.fee_kemites = kem_to_kemites(fee_kemites)
 
     def prepare_metadata(self, blockchain):
         """
@@ -83,6 +104,21 @@ class WalletLibraryTransaction:
         """
         return blockchain.library_ai.process_content(self.content, {"uploader": self.uploader, "title": self.title})
 
+    def build_transaction(self, metadata):
+        """
+        Build the library transaction payload, including metadata, as a typed struct.
+        :param metadata: Metadata dictionary generated by the blockchain AI librarian.
+        :return: LibraryTxn representing the library transaction.
+        """
+        return LibraryTxn(
+            uploader=self.uploader,
+            title=self.title,
+            cid=metadata.get("cid"),
+            hash_value=metadata.get("hash"),
+            category=self.category,
+            fee_kemites=self.fee_kemites,
+        )
+
     def get_transaction_data(self, metadata):
         """
         Returns the transaction data as a dictionary, including metadata for broadcasting.
@@ -93,12 +129,21 @@ class WalletLibraryTransaction:
             "type": "library",
             "uploader": self.uploader,
             "title": self.title,
-            "cid": metadata.get("cid", None),
-            "hash_value": metadata.get("hash", None),
+            "cid": metadata.get("cid"),
+            "hash_value": metadata.get("hash"),
             "category": self.category,
             "fee_kemites": self.fee_kemites,
         }
 
+    def encode_transaction_data(self, metadata):
+        """
+        Returns the transaction data as JSON bytes, encoded straight from the struct without an intermediate dict.
+        This is what Network.broadcast_library_transaction sends.
+        :param metadata: Metadata dictionary generated by the blockchain AI librarian.
+        :return: JSON-encoded library transaction.
+        """
+        return msgspec.json.encode(self.build_transaction(metadata))
+
     def __str__(self):
         """
         Provides a readable string representation of the library transaction.
@@ -4,38 +4,152 @@
 import os
 import json
 import hashlib
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives.hashes import SHA256
 import base64
+import binascii
+import functools
 import logging
+import orjson
 import requests
 import secrets
+import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
+from argon2.low_level import Type, hash_secret_raw
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from ecdsa_keygen import ECDSA_keygen
+from mnemonic import Mnemonic
+from network import build_session
 
 SALT_SIZE = 16
-ITERATIONS = 100_000
+ITERATIONS = 100_000  # PBKDF2 rounds for wallet files that do not record their own count
+NEW_WALLET_ITERATIONS = 600_000  # OWASP 2023 guidance for PBKDF2-HMAC-SHA256
 KEY_LENGTH = 32
 WALLET_FILE = "wallet.json"
+WORDS_FILE = "/usr/share/dict/words"
+BALANCE_TTL = 3.0  # Seconds a fetched balance is reused before /get_balance is queried again
+
+# Encryption-key KDFs recorded in the wallet file; files without a "kdf" field predate Argon2id
+KDF_PBKDF2 = "pbkdf2-sha256"
+KDF_ARGON2ID = "argon2id"
+
+# Argon2id parameters (RFC 9106 second recommended option)
+ARGON2_TIME_COST = 3
+ARGON2_MEMORY_COST = 64 * 1024  # KiB
+ARGON2_PARALLELISM = 4
+
+# Seed-phrase encryption recorded in the wallet file; older files hold a one-way PBKDF2 digest instead
+SEED_CIPHER = "aes-256-gcm"
+NONCE_SIZE = 12
+
+_URLSAFE = bytes.maketrans(b"+/", b"-_")  # Standard to URL-safe base64 alphabet
 
 logging.basicConfig(level=logging.INFO)
 
 
+def _b64encode(data):
+    """
+    URL-safe base64 text of `data`, identical to base64.urlsafe_b64encode(data).decode().
+    """
+    return binascii.b2a_base64(data, newline=False).translate(_URLSAFE).decode("ascii")
+
+
+def _write_json_atomic(path, data):
+    """
+    Write `data` as JSON to `path` so that a crash leaves either the old file or the new one, never a
+    truncated mix. The document is written in one call to a uniquely named temporary file beside `path`,
+    synced, renamed over `path`, and the rename itself is synced. Concurrent saves never share a
+    temporary file, and a failed write removes its temporary file instead of leaving wallet data behind.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(json.dumps(data))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    if os.name == "posix":
+        # Directories cannot be opened for fsync on Windows
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+@functools.lru_cache(maxsize=4)
+def _derive_key(password, salt, iterations=ITERATIONS):
+    """
+    Run PBKDF2 once per (password, salt, iterations); the private key, address and legacy encryption key
+    all derive from it.
+    """
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations, KEY_LENGTH)
+
+
+@functools.lru_cache(maxsize=4)
+def _derive_argon2_key(password, salt):
+    """
+    Derive a memory-hard encryption key with Argon2id.
+    """
+    return hash_secret_raw(
+        password.encode(), salt,
+        time_cost=ARGON2_TIME_COST,
+        memory_cost=ARGON2_MEMORY_COST,
+        parallelism=ARGON2_PARALLELISM,
+        hash_len=KEY_LENGTH,
+        type=Type.ID,
+    )
+
+
+_WORDS = None  # Seed-phrase word list, read once per process
+
+
+def _words():
+    """
+    Return the seed-phrase word list, loading the system dictionary on first use.
+    Falls back to the BIP39 English list where the dictionary is missing (e.g. Windows).
+    """
+    global _WORDS
+    if _WORDS is None:
+        try:
+            with open(WORDS_FILE) as file:
+                _WORDS = [word for word in (line.strip() for line in file) if word]
+        except OSError:
+            _WORDS = list(Mnemonic("english").wordlist)
+    return _WORDS
+
+
 class Wallet:
-    def __init__(self, password, blockchain_url="http://127.0.0.1:5000"):
+    def __init__(self, password, blockchain_url="http://127.0.0.1:5000", autoload=True):
         """
         Initialize the wallet with password and blockchain URL.
         If a wallet file exists, load the wallet; otherwise, create a new one.
+        Pass autoload=False to call load_wallet or create_new_wallet yourself.
         """
         self.password = password
         self.blockchain_url = blockchain_url
+        self._session = build_session()  # Keep-alive connection pool for node RPC calls
         self.wallet_file = WALLET_FILE
         self.salt = None
+        self.kdf = KDF_ARGON2ID  # KDF for the encryption key; loaded wallets keep the one they were created with
+        self.iterations = NEW_WALLET_ITERATIONS  # PBKDF2 rounds; loaded wallets keep the count they were created with
         self.key = None
         self.address = None
         self.encrypted_seed_phrase = None
+        self.seed_cipher = SEED_CIPHER
         self.balance = 0
+        self._balance_fetched_at = None  # time.monotonic() of the last successful balance query
+        self._private_key = None  # Derived once per unlock; the address is derived from the same key
+        self._signer = None  # ECDSA_keygen holding the private key, built on first signature
 
+        if not autoload:
+            return
         if os.path.exists(self.wallet_file):
             self.load_wallet(password)
         else:
@@ -43,52 +157,84 @@ class Wallet:
 
     def _generate_encryption_key(self, salt):
         """
-        Generate an encryption key using PBKDF2 and the provided salt.
+        Generate an encryption key using the wallet's KDF (Argon2id, or PBKDF2 for older wallets) and the provided salt.
+        """
+        if self.kdf == KDF_ARGON2ID:
+            return base64.urlsafe_b64encode(_derive_argon2_key(self.password, salt))
+        return base64.urlsafe_b64encode(_derive_key(self.password, salt, self.iterations))
+
+    def _derive_private_key(self, salt):
+        """
+        Derive the wallet's private key from the password and salt.
         """
-        kdf = PBKDF2HMAC(
-            algorithm=SHA256(),
-            length=KEY_LENGTH,
-            salt=salt,
-            iterations=ITERATIONS,
-            backend=default_backend(),
-        )
-        return base64.urlsafe_b64encode(kdf.derive(self.password.encode()))
+        return _derive_key(self.password, salt or b"", self.iterations)
 
     def _generate_wallet_address(self, salt):
         """
         Generate a unique wallet address using the password and salt.
         """
-        derived_key = hashlib.pbkdf2_hmac("sha256", self.password.encode(), salt, ITERATIONS)
-        return f"address_{hashlib.sha256(derived_key).hexdigest()[:16]}"
+        self._private_key = self._derive_private_key(salt)
+        self._signer = None
+        return f"address_{hashlib.sha256(self._private_key).hexdigest()[:16]}"
+
+    def _derive_keys(self, salt):
+        """
+        Derive the encryption key and the wallet address for a salt, running both KDFs at once.
+
+        hashlib.pbkdf2_hmac and Argon2id both release the GIL, so the two derivations use separate cores.
+        """
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            key = pool.submit(self._generate_encryption_key, salt)
+            address = pool.submit(self._generate_wallet_address, salt)
+            self.key = key.result()
+            self.address = address.result()
+
+    def _get_signer(self):
+        """
+        Return the wallet's ECDSA signer, deriving the private key only if this wallet has not done so yet.
+        """
+        if self._signer is None:
+            if self._private_key is None:
+                self._private_key = self._derive_private_key(self.salt)
+            self._signer = ECDSA_keygen()
+            self._signer.private_key = self._private_key.hex()  # Hex text, not the raw KDF bytes
+        return self._signer
 
     def create_new_wallet(self):
         """
         Create a new wallet with a unique address and encrypted seed phrase.
         """
         self.salt = os.urandom(SALT_SIZE)
-        self.key = self._generate_encryption_key(self.salt)
-        self.address = self._generate_wallet_address(self.salt)
-        seed_phrase = " ".join(secrets.choice(open("/usr/share/dict/words").readlines()).strip() for _ in range(12))
+        self.kdf = KDF_ARGON2ID
+        self.iterations = NEW_WALLET_ITERATIONS
+        self.seed_cipher = SEED_CIPHER
+        self._derive_keys(self.salt)
+        seed_phrase = " ".join(secrets.choice(_words()) for _ in range(12))
         self.encrypted_seed_phrase = self.encrypt_seed_phrase(seed_phrase)
         self.save_wallet()
         logging.info(f"New wallet created. Address: {self.address}")
 
     def encrypt_seed_phrase(self, seed_phrase):
         """
-        Encrypt the seed phrase using the wallet's encryption key.
+        Encrypt the seed phrase with AES-256-GCM under the wallet's encryption key.
+        :return: base64 of the random nonce followed by the ciphertext and tag.
         """
-        return base64.urlsafe_b64encode(
-            hashlib.pbkdf2_hmac(
-                "sha256", seed_phrase.encode(), self.key, ITERATIONS
-            )
-        ).decode()
+        nonce = os.urandom(NONCE_SIZE)
+        ciphertext = AESGCM(base64.urlsafe_b64decode(self.key)).encrypt(nonce, seed_phrase.encode(), None)
+        return _b64encode(nonce + ciphertext)
 
     def decrypt_seed_phrase(self):
         """
         Decrypt the seed phrase using the wallet's encryption key.
+        Returns None for wallets created before seed phrases were encrypted, which only stored a digest.
         """
+        if self.seed_cipher != SEED_CIPHER or self.key is None:
+            logging.error("Seed phrase of this wallet is not recoverable.")
+            return None
         try:
-            return base64.urlsafe_b64decode(self.encrypted_seed_phrase).decode()
+            blob = base64.urlsafe_b64decode(self.encrypted_seed_phrase)
+            nonce, ciphertext = blob[:NONCE_SIZE], blob[NONCE_SIZE:]
+            return AESGCM(base64.urlsafe_b64decode(self.key)).decrypt(nonce, ciphertext, None).decode()
         except Exception as e:
             logging.error(f"Failed to decrypt seed phrase: {e}")
             return None
@@ -99,11 +245,13 @@ class Wallet:
         """
         data = {
             "address": self.address,
-            "salt": base64.urlsafe_b64encode(self.salt).decode() if self.salt else None,
+            "salt": _b64encode(self.salt) if self.salt else None,
+            "kdf": self.kdf,
+            "iterations": self.iterations,
             "encrypted_seed_phrase": self.encrypted_seed_phrase,
+            "seed_cipher": self.seed_cipher,
         }
-        with open(self.wallet_file, "w") as file:
-            json.dump(data, file)
+        _write_json_atomic(self.wallet_file, data)
         logging.info("Wallet saved successfully.")
 
     def load_wallet(self, password):
@@ -114,11 +262,14 @@ class Wallet:
             with open(self.wallet_file, "r") as file:
                 data = json.load(file)
 
+            # The seed phrase was encrypted under this KDF's key, so the wallet keeps it
+            self.kdf = data.get("kdf", KDF_PBKDF2)
+            self.iterations = data.get("iterations", ITERATIONS)
+
             # Backward compatibility: If salt is missing, assume it's an old wallet
             if "salt" in data and data["salt"]:
                 self.salt = base64.urlsafe_b64decode(data["salt"])
-                self.key = self._generate_encryption_key(self.salt)
-                self.address = self._generate_wallet_address(self.salt)
+                self._derive_keys(self.salt)
             else:
                 # Old wallet logic: Address stored directly in the file
                 self.salt = None
@@ -126,6 +277,7 @@ class Wallet:
                 self.address = data["address"]
 
             self.encrypted_seed_phrase = data.get("encrypted_seed_phrase")
+            self.seed_cipher = data.get("seed_cipher")
             logging.info(f"Wallet loaded successfully. Address: {self.address}")
         except FileNotFoundError:
             raise ValueError("Wallet file not found.")
@@ -135,15 +287,20 @@ class Wallet:
             logging.error(f"Error loading wallet: {e}")
             raise
 
-    def query_balance(self):
+    def query_balance(self, force=False):
         """
         Query the wallet's balance from the blockchain.
+        A balance fetched less than BALANCE_TTL seconds ago is returned without a new request unless force is set.
         """
+        fetched_at = self._balance_fetched_at
+        if not force and fetched_at is not None and time.monotonic() - fetched_at < BALANCE_TTL:
+            return self.balance
         try:
-            response = requests.get(f"{self.blockchain_url}/get_balance/{self.address}")
+            response = self._session.get(f"{self.blockchain_url}/get_balance/{self.address}")
             if response.status_code == 200:
                 balance_data = response.json()
                 self.balance = balance_data.get("balance", 0) / 10**8  # Convert to KEM
+                self._balance_fetched_at = time.monotonic()
                 return self.balance
             else:
                 error_msg = response.json().get("error", "Unknown error")
@@ -152,22 +309,31 @@ class Wallet:
             logging.error(f"Connection error while fetching balance: {e}")
             return 0
 
-    def refresh_balance(self):
+    def refresh_balance(self, force=False):
         """
         Refresh the wallet balance and return the updated value.
+        :param force: Bypass the short-lived balance cache, e.g. for an explicit user refresh.
         """
-        self.balance = self.query_balance()
+        self.balance = self.query_balance(force=force)
         logging.info(f"Balance refreshed: {self.balance} KEM")
         return self.balance
 
     def sign_transaction(self, data):
         """
-        Create a cryptographic signature for a transaction using the private key.
+        Create an ECDSA signature over the SHA-256 of the canonical transaction JSON using the private key.
+        Like every other ECDSA_keygen caller, the signer is given a str message. A bytes signature is
+        returned as URL-safe base64 text; a str signature is returned unchanged.
         """
-        private_key = hashlib.pbkdf2_hmac("sha256", self.password.encode(), self.salt or b"", ITERATIONS)
-        transaction_hash = hashlib.sha256(json.dumps(data).encode()).digest()
-        signature = hashlib.pbkdf2_hmac("sha256", transaction_hash, private_key, ITERATIONS)
-        return base64.urlsafe_b64encode(signature).decode()
+        # Canonical (sorted-key) JSON, so signer and verifier hash the same preimage
+        message = hashlib.sha256(orjson.dumps(data, option=orjson.OPT_SORT_KEYS)).hexdigest()
+        signer = self._get_signer()
+        signature = signer.sign_message(message)
+        # Round-trip check: never hand out a signature the wallet's own key does not verify
+        if not signer.verify_signature(signature, message):
+            raise ValueError("Transaction signature failed verification.")
+        if isinstance(signature, str):
+            return signature
+        return _b64encode(signature)
 
     def send_transaction(self, recipient, amount):
         """
@@ -183,12 +349,13 @@ class Wallet:
         transaction_data["signature"] = signature
 
         try:
-            response = requests.post(
+            response = self._session.post(
                 f"{self.blockchain_url}/add_transaction",
                 json=transaction_data
             )
             if response.status_code == 200:
                 logging.info("Transaction sent successfully.")
+                self._balance_fetched_at = None  # The cached balance predates this transaction
                 return response.json()
             else:
                 error_msg = response.json().get("error", "Unknown error")
@@ -206,8 +373,7 @@ class Wallet:
                 "address": self.address,
                 "encrypted_seed_phrase": self.encrypted_seed_phrase,
             }
-            with open(export_path, "w") as file:
-                json.dump(data, file)
+            _write_json_atomic(export_path, data)
             logging.info(f"Wallet exported successfully to {export_path}.")
         except Exception as e:
             logging.error(f"Failed to export wallet: {e}")
@@ -3,11 +3,10 @@
 
 import os
 import logging
+import threading
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import ttk
-from PIL import Image, ImageTk
-import qrcode
 from wallet import Wallet
 
 logging.basicConfig(level=logging.INFO)
@@ -21,25 +20,36 @@ class KembacoinWalletApp:
         self.wallet = None
         self.blockchain_url = "http://127.0.0.1:5000"
         self.logo_path = os.path.abspath("kembacoin7/kembacoin Logo/sealfinalkemcoin.png")
-        self.qr_code_path = "wallet_qr.png"  # Path to save the QR code
+        self._busy = False  # True while a background wallet operation is running
+        self._logo = self._load_logo()  # Decoded once; every main-screen build reuses it
+        self._qr_address = None  # Address the in-memory QR image was last generated for
+        self._qr_image = None  # PIL image of the QR code, rendered without a PNG file
+        self._qr_photo = None  # Decoded QR image, reused while the address is unchanged
+        self._qr_photo_address = None
 
         # Create main UI
         self.create_main_screen()
 
+    def _load_logo(self):
+        """
+        Load the logo image, or return None if it is missing or unreadable.
+        """
+        if not os.path.exists(self.logo_path):
+            return None
+        try:
+            return tk.PhotoImage(file=self.logo_path)
+        except Exception as e:
+            logging.warning(f"Failed to load logo: {e}")
+            return None
+
     def create_main_screen(self):
         # Clear window
         for widget in self.root.winfo_children():
             widget.destroy()
 
         # Logo
-        if os.path.exists(self.logo_path):
-            try:
-                logo = tk.PhotoImage(file=self.logo_path)
-                logo_label = tk.Label(self.root, image=logo)
-                logo_label.image = logo  # Keep reference to prevent garbage collection
-                logo_label.pack(pady=10)
-            except Exception as e:
-                logging.warning(f"Failed to load logo: {e}")
+        if self._logo is not None:
+            tk.Label(self.root, image=self._logo).pack(pady=10)  # self._logo keeps the image alive
 
         # Password entry
         self.password_var = tk.StringVar()
@@ -59,42 +69,93 @@ class KembacoinWalletApp:
             wraplength=300,
         ).pack(pady=10)
 
+    def run_in_background(self, work, on_success, on_error):
+        """
+        Run `work` on a worker thread with a progress bar shown, keeping the Tk event loop responsive.
+        The outcome is handed back to the Tk thread via root.after.
+        :param work: Callable doing the slow part (key derivation, file I/O); its return value goes to on_success.
+        :param on_success: Called on the Tk thread with the result.
+        :param on_error: Called on the Tk thread with the raised exception.
+        """
+        self._busy = True
+        progress = ttk.Progressbar(self.root, mode="indeterminate", length=200)
+        progress.pack(pady=5)
+        progress.start(10)
+
+        def finish(result, error):
+            self._busy = False
+            progress.stop()
+            progress.destroy()
+            if error is None:
+                on_success(result)
+            else:
+                on_error(error)
+
+        def target():
+            try:
+                result = work()
+            except Exception as e:
+                self.root.after(0, finish, None, e)
+            else:
+                self.root.after(0, finish, result, None)
+
+        threading.Thread(target=target, daemon=True).start()
+
     def create_wallet(self):
+        if self._busy:
+            return
         password = self.password_var.get().strip()
         if not password:
             messagebox.showerror("Error", "Password cannot be empty!")
             return
 
-        try:
-            self.wallet = Wallet(password=password, blockchain_url=self.blockchain_url)
-            self.wallet.create_new_wallet()
-            logging.info("Wallet created successfully.")
-            messagebox.showinfo("Success", f"Wallet created successfully!\nAddress: {self.wallet.address}")
-            self.generate_qr_code(self.wallet.address)  # Generate QR code
-            self.show_wallet_screen()
-        except Exception as e:
+        def work():
+            wallet = Wallet(password=password, blockchain_url=self.blockchain_url, autoload=False)
+            wallet.create_new_wallet()
+            self.generate_qr_code(wallet.address)  # Generate QR code
+            return wallet
+
+        def on_error(e):
             logging.error(f"Failed to create wallet: {e}")
             messagebox.showerror("Error", "Failed to create wallet. Please try again.")
 
+        self.run_in_background(work, self._on_wallet_created, on_error)
+
+    def _on_wallet_created(self, wallet):
+        self.wallet = wallet
+        logging.info("Wallet created successfully.")
+        messagebox.showinfo("Success", f"Wallet created successfully!\nAddress: {self.wallet.address}")
+        self.show_wallet_screen()
+
     def login_wallet(self):
+        if self._busy:
+            return
         password = self.password_var.get().strip()
         if not password:
             messagebox.showerror("Error", "Password cannot be empty!")
             return
 
-        try:
-            self.wallet = Wallet(password=password, blockchain_url=self.blockchain_url)
-            self.wallet.load_wallet(password)
-            logging.info("Wallet loaded successfully.")
-            messagebox.showinfo("Success", f"Wallet loaded successfully!\nAddress: {self.wallet.address}")
-            self.generate_qr_code(self.wallet.address)  # Generate QR code
-            self.show_wallet_screen()
-        except ValueError as e:
-            logging.error(f"Failed to load wallet: {e}")
-            messagebox.showerror("Error", f"Invalid password or corrupted wallet file: {e}")
-        except Exception as e:
-            logging.error(f"Unexpected error while loading wallet: {e}")
-            messagebox.showerror("Error", "An unexpected error occurred. Please try again.")
+        def work():
+            wallet = Wallet(password=password, blockchain_url=self.blockchain_url, autoload=False)
+            wallet.load_wallet(password)
+            self.generate_qr_code(wallet.address)  # Generate QR code
+            return wallet
+
+        def on_error(e):
+            if isinstance(e, ValueError):
+                logging.error(f"Failed to load wallet: {e}")
+                messagebox.showerror("Error", f"Invalid password or corrupted wallet file: {e}")
+            else:
+                logging.error(f"Unexpected error while loading wallet: {e}")
+                messagebox.showerror("Error", "An unexpected error occurred. Please try again.")
+
+        self.run_in_background(work, self._on_wallet_loaded, on_error)
+
+    def _on_wallet_loaded(self, wallet):
+        self.wallet = wallet
+        logging.info("Wallet loaded successfully.")
+        messagebox.showinfo("Success", f"Wallet loaded successfully!\nAddress: {self.wallet.address}")
+        self.show_wallet_screen()
 
     def show_wallet_screen(self):
         # Clear window
@@ -108,16 +169,18 @@ class KembacoinWalletApp:
 
         tk.Label(self.root, text=f"Balance: {self.wallet.refresh_balance():.2f} KEM", font=("Arial", 12)).pack(pady=5)
 
-        # QR Code
-        if os.path.exists(self.qr_code_path):
+        # QR Code, decoded only when the wallet address changes
+        if (self._qr_photo_address != self.wallet.address and self._qr_image is not None
+                and self._qr_address == self.wallet.address):
             try:
-                qr_image = Image.open(self.qr_code_path)
-                qr_photo = ImageTk.PhotoImage(qr_image)
-                qr_label = tk.Label(self.root, image=qr_photo)
-                qr_label.image = qr_photo  # Keep reference to prevent garbage collection
-                qr_label.pack(pady=10)
+                from PIL import ImageTk  # Imported on first display; importing wallet_gui stays light
+
+                self._qr_photo = ImageTk.PhotoImage(self._qr_image)
+                self._qr_photo_address = self.wallet.address
             except Exception as e:
                 logging.error(f"Failed to display QR code: {e}")
+        if self._qr_photo is not None and self._qr_photo_address == self.wallet.address:
+            tk.Label(self.root, image=self._qr_photo).pack(pady=10)  # self._qr_photo keeps the image alive
 
         # Frame for Action Buttons
         action_frame = tk.Frame(self.root)
@@ -136,13 +199,26 @@ class KembacoinWalletApp:
 
         ttk.Button(action_frame, text="Send KEM", command=self.send_kem).grid(row=0, column=0, padx=10)
         ttk.Button(action_frame, text="Export Wallet", command=self.export_wallet).grid(row=0, column=1, padx=10)
-        ttk.Button(action_frame, text="Logout", command=self.create_main_screen).grid(row=0, column=2, padx=10)
+        ttk.Button(action_frame, text="Refresh", command=self.refresh_wallet_screen).grid(row=0, column=2, padx=10)
+        ttk.Button(action_frame, text="Logout", command=self.create_main_screen).grid(row=0, column=3, padx=10)
+
+    def refresh_wallet_screen(self):
+        """
+        Re-query the balance, bypassing the wallet's balance cache, and rebuild the wallet screen.
+        """
+        self.wallet.refresh_balance(force=True)
+        self.show_wallet_screen()
 
     def generate_qr_code(self, data):
         """
-        Generate a QR code for the wallet address and save it as an image.
+        Generate a QR code for the wallet address as an in-memory image.
+        Skipped when the image was already generated for this address.
         """
+        if data == self._qr_address and self._qr_image is not None:
+            return
         try:
+            import qrcode  # Imported on first use, together with its PIL image backend
+
             qr = qrcode.QRCode(
                 version=1,
                 error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -152,9 +228,9 @@ class KembacoinWalletApp:
             qr.add_data(data)
             qr.make(fit=True)
 
-            img = qr.make_image(fill_color="black", back_color="white")
-            img.save(self.qr_code_path)
-            logging.info(f"QR Code generated and saved to {self.qr_code_path}.")
+            self._qr_image = qr.make_image(fill_color="black", back_color="white").convert("RGB")
+            self._qr_address = data
+            logging.info("QR Code generated.")
         except Exception as e:
             logging.error(f"Failed to generate QR code: {e}")
 
@@ -177,15 +253,19 @@ class KembacoinWalletApp:
             messagebox.showerror("Error", f"Transaction failed. Reason: {e}")
 
     def export_wallet(self):
+        if self._busy:
+            return
         export_path = "wallet_export.json"
-        try:
-            self.wallet.export_wallet(export_path)
+
+        def on_success(_):
             logging.info(f"Wallet exported to {export_path}")
             messagebox.showinfo("Success", f"Wallet exported successfully to {export_path}.")
-        except Exception as e:
+
+        def on_error(e):
             logging.error(f"Failed to export wallet: {e}")
             messagebox.showerror("Error", "Failed to export wallet. Please try again.")
 
+        self.run_in_background(lambda: self.wallet.export_wallet(export_path), on_success, on_error)
 
 if __name__ == "__main__":
     root = tk.Tk()